@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from collections import deque
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+async def remove_spam(bot, chat_id, message_id, user_id):
+    """Delete the message and ban its author at the same time.
+
+    Returns {action: error} for the actions that failed, empty when both succeeded.
+    """
+    results = await asyncio.gather(
+        bot.delete_message(chat_id=chat_id, message_id=message_id),
+        bot.ban_chat_member(chat_id=chat_id, user_id=user_id),
+        return_exceptions=True,
+    )
+    errors = {}
+    for action, result in zip(("delete", "ban"), results):
+        if isinstance(result, TelegramError):
+            errors[action] = result
+        elif isinstance(result, BaseException):
+            raise result
+    return errors
+
+
+async def send_media_copy(bot, chat_id, message, caption, rate_limit_args=None):
+    """Re-send the media of a message by file_id, which still works after the original is deleted."""
+    options = {"caption": caption, "parse_mode": "HTML", "rate_limit_args": rate_limit_args}
+    if message.photo:
+        return await bot.send_photo(chat_id, message.photo[-1].file_id, **options)
+    # Animations also carry a document, so they have to be checked first
+    if message.animation:
+        return await bot.send_animation(chat_id, message.animation.file_id, **options)
+    if message.video:
+        return await bot.send_video(chat_id, message.video.file_id, **options)
+    if message.document:
+        return await bot.send_document(chat_id, message.document.file_id, **options)
+    if message.audio:
+        return await bot.send_audio(chat_id, message.audio.file_id, **options)
+    if message.voice:
+        return await bot.send_voice(chat_id, message.voice.file_id, **options)
+    return await bot.send_message(chat_id, caption, parse_mode="HTML", disable_web_page_preview=True,
+                                  rate_limit_args=rate_limit_args)
+
+
+class NotificationQueue:
+    """Owner reports, sent by background tasks so they never delay moderation.
+
+    Every owner has a queue and a worker of their own: Telegram lets the bot send about
+    one message a second to a private chat, so a burst of reports to one owner must not
+    hold up the others. A worker is started by the first report and exits once its
+    queue is empty.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._queues = {}
+        self._workers = {}
+
+    async def stop(self):
+        for worker in list(self._workers.values()):
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+
+    async def drain(self, timeout):
+        """Wait until the queued reports are sent, at most timeout seconds. Returns False when some are left."""
+        workers = list(self._workers.values())
+        if not workers:
+            return True
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        if pending:
+            logger.warning("Owner reports still unsent at shutdown, %d of them queued", len(self))
+            return False
+        return True
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, owner_id, send):
+        """Queue a zero-argument coroutine function for an owner. Reports beyond maxsize per owner are dropped."""
+        queue = self._queues.get(owner_id)
+        if queue is None:
+            queue = self._queues[owner_id] = deque()
+            self._workers[owner_id] = asyncio.create_task(self._run(owner_id, queue))
+        if len(queue) >= self.maxsize:
+            self.dropped += 1
+            logger.warning("Notification queue of owner %s is full, dropping a report", owner_id)
+            return
+        queue.append(send)
+
+    async def _run(self, owner_id, queue):
+        try:
+            while queue:
+                send = queue.popleft()
+                try:
+                    await send()
+                except TelegramError as e:
+                    print(f"Ошибка при отправке уведомления: {str(e)}")
+                except Exception:
+                    logger.exception("Notification failed")
+        finally:
+            del self._queues[owner_id]
+            del self._workers[owner_id]
@@ -1,32 +1,126 @@
+import asyncio
 import logging
 import os
-import emoji
+import secrets
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackContext, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackContext, CallbackQueryHandler, ChatMemberHandler
 from telegram.error import TelegramError, BadRequest, Forbidden
-from tinydb import TinyDB, Query
-from is_spam_message import new_is_spam_message, has_critical_patterns, has_mixed_words
+from classifier import EMOJI_LIMIT, VerdictCache, classifier, near_duplicates
+from classification_executor import ClassificationExecutor
+from near_duplicates import VOTE
+from normalization import NormalizedMessage
+from owner_index import OwnerIndex
+from chat_cache import ChatInfoCache
+from update_processor import PerChatUpdateProcessor
+from actions import NotificationQueue, remove_spam, send_media_copy
+from digest import DigestCollector
+from outbound import REPORT, OutboundScheduler
+from storage import AsyncStorage, open_storage
+from metrics import MetricsServer, RateLimitedCounter
+import bot_metrics
+from bot_metrics import InstrumentedRequest, phase_seconds
 from private_decorator_definition import private_chat_only
+from rule_reloader import RuleReloader
+from votes import Vote, VoteStore
 
 load_dotenv()
 
 TOKEN = os.getenv('ANTISPAM_TOKEN')
+# Public HTTPS address Telegram posts updates to. When set, the bot runs a webhook
+# listener instead of long polling.
+WEBHOOK_URL = os.getenv('ANTISPAM_WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('ANTISPAM_WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('ANTISPAM_WEBHOOK_PORT', '8443'))
+# Local path of the listener; by default the path of WEBHOOK_URL, which differs only behind a rewriting proxy
+WEBHOOK_PATH = os.getenv('ANTISPAM_WEBHOOK_PATH', urlparse(WEBHOOK_URL).path if WEBHOOK_URL else '').strip('/')
+# Telegram sends it with every request and the listener rejects requests without it.
+# A random one is registered on each start when none is configured.
+WEBHOOK_SECRET = os.getenv('ANTISPAM_WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+# Updates processed at the same time; updates of one chat are still handled in order
+CONCURRENT_UPDATES = int(os.getenv('ANTISPAM_CONCURRENT_UPDATES', '32'))
+# Telegram ids of the people who run the bot, comma-separated; they may reload the rules
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ANTISPAM_ADMIN_IDS', '').split(',') if user_id.strip()}
+# Seconds between checks of the rule files for changes
+RULES_POLL_INTERVAL = float(os.getenv('ANTISPAM_RULES_POLL_INTERVAL', '5'))
+# Local port of the Prometheus metrics endpoint; not served when unset
+METRICS_PORT = os.getenv('ANTISPAM_METRICS_PORT')
+# Worker processes that classify long texts off the event loop; 0 classifies everything inline
+CLASSIFY_WORKERS = int(os.getenv('ANTISPAM_CLASSIFY_WORKERS', '0'))
+# Texts at least this long go to a worker
+OFFLOAD_LENGTH = int(os.getenv('ANTISPAM_OFFLOAD_LENGTH', '200'))
+# Seconds to wait for a worker before the text is checked by the cheap stages only
+CLASSIFY_TIMEOUT = float(os.getenv('ANTISPAM_CLASSIFY_TIMEOUT', '2'))
+# JSON file that keeps /ban votes in progress across restarts
+VOTES_PATH = os.getenv('ANTISPAM_VOTES_PATH', "./ban_votes.json")
+# Largest emoji limit an owner may set
+MAX_EMOJI_LIMIT = 1000
+# Longest digest period an owner may choose, in minutes
+MAX_DIGEST_MINUTES = 24 * 60
+# Seconds the bot waits on shutdown for queued owner reports and digests to be sent
+SHUTDOWN_REPORT_TIMEOUT = float(os.getenv('ANTISPAM_SHUTDOWN_REPORT_TIMEOUT', '60'))
 
 logging.basicConfig(level=logging.WARNING, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
                     filename="bot.log",
                     filemode="a")
 
-# Initialize TinyDB
-db_main_file = "./bot_database.json"
-if not os.path.exists(db_main_file):
-    with open(db_main_file, "w") as file:
-        file.write("{}")
-db_main = TinyDB(db_main_file)
-User = Query()
-
-ban_votes = {}
+# TinyDB by default, SQLite with ANTISPAM_STORAGE=sqlite. Handlers await it; the
+# actual file access runs on a dedicated thread.
+storage = AsyncStorage(open_storage())
+
+# Read by the message path instead of the database
+owner_index = OwnerIndex()
+owner_index.load(storage.backend.all_users())
+
+# /ban votes in progress; abandoned ones expire and their messages are removed
+votes = VoteStore(VOTES_PATH)
+
+# Chat titles and admin statuses, shared by all handlers
+chat_cache = ChatInfoCache()
+
+# Owner reports are sent in the background, after the spam is gone, by one worker per owner
+notifications = NotificationQueue()
+
+# Bans of owners who asked for a digest, reported in one message per window
+digests = DigestCollector(notifications)
+
+# Every Bot API request goes through it: moderation first, owner reports last
+outbound = OutboundScheduler()
+
+# Copies of one spam text posted across many chats are classified once
+verdict_cache = VerdictCache(classifier)
+classification_executor = ClassificationExecutor(classifier, CLASSIFY_WORKERS, OFFLOAD_LENGTH, CLASSIFY_TIMEOUT)
+
+unregistered_messages = RateLimitedCounter("Messages from unregistered chats")
+
+# Rule files are recompiled in the background when they change
+rule_reloader = RuleReloader(interval=RULES_POLL_INTERVAL)
+
+classifier.observe = lambda stage, seconds: bot_metrics.stage_seconds.observe(seconds, stage)
+bot_metrics.registry.callback("antispam_verdict_cache_hits_total", "Verdicts served from the cache",
+                              lambda: verdict_cache.hits, "counter")
+bot_metrics.registry.callback("antispam_verdict_cache_misses_total", "Verdicts computed by the classifier",
+                              lambda: verdict_cache.misses, "counter")
+bot_metrics.registry.callback("antispam_offloaded_classifications_total",
+                              "Texts classified by a worker process", lambda: classification_executor.offloaded, "counter")
+bot_metrics.registry.callback("antispam_classification_timeouts_total",
+                              "Worker classifications that timed out; only the cheap stages ran",
+                              lambda: classification_executor.timeouts, "counter")
+bot_metrics.registry.callback("antispam_near_duplicates", "Banned texts in the near-duplicate index",
+                              lambda: len(near_duplicates))
+bot_metrics.registry.callback("antispam_pending_notifications", "Owner reports waiting to be sent",
+                              lambda: len(notifications))
+bot_metrics.registry.callback("antispam_dropped_notifications_total",
+                              "Owner reports dropped because the owner's queue was full",
+                              lambda: notifications.dropped, "counter")
+bot_metrics.registry.callback("antispam_ban_votes", "/ban votes in progress", lambda: len(votes))
+bot_metrics.registry.callback("antispam_open_digests", "Owners with bans waiting for their digest",
+                              lambda: len(digests))
+bot_metrics.registry.callback("antispam_outbound_waiting", "Bot API requests waiting for the global rate limit",
+                              lambda: outbound.waiting)
+metrics_server = MetricsServer(bot_metrics.registry, int(METRICS_PORT)) if METRICS_PORT else None
 
 @private_chat_only
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -47,18 +141,10 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     try:
-        chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
         if chat_member.status in ['creator', 'administrator']:
-            user_data = db_main.get(User.user_id == user_id)
-            if user_data:
-                if chat_id not in user_data['chats']:
-                    user_data['chats'].append(chat_id)
-                    if 'delete_statuses' not in user_data:
-                        user_data['delete_statuses'] = {}
-                    user_data['delete_statuses'][str(chat_id)] = False
-                    db_main.update(user_data, User.user_id == user_id)
-            else:
-                db_main.insert({'user_id': user_id, 'chats': [chat_id], 'delete_statuses': {str(chat_id): False}})
+            user_data = await storage.register_chat(user_id, chat_id)
+            owner_index.update_user(user_data)
             await update.message.reply_text(f'Зарегистрирован чат {chat_id}')
         else:
             await update.message.reply_text('Вы не администратор этого чата.')
@@ -81,12 +167,10 @@ async def unregister(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text('Неверный формат идентификатора чата. Используйте числовой ID.')
         return
     
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     if user_data and chat_id in user_data['chats']:
-        user_data['chats'].remove(chat_id)
-        if 'delete_statuses' in user_data:
-            user_data['delete_statuses'].pop(str(chat_id), None)
-        db_main.update(user_data, User.user_id == user_id)
+        user_data = await storage.unregister_chat(user_id, chat_id)
+        owner_index.update_user(user_data)
         await update.message.reply_text(f'Отменена регистрация чата {chat_id}.')
     else:
         await update.message.reply_text('Чат не зарегистрирован.')
@@ -94,13 +178,18 @@ async def unregister(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 @private_chat_only
 async def list_chats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     
     if user_data and user_data['chats']:
         chat_list = "Ваши зарегистрированные чаты:\n\n"
-        for chat_id in user_data['chats']:
+        # Request all chats at once instead of one round trip after another
+        chats = await asyncio.gather(
+            *(chat_cache.get_chat(context.bot, chat_id) for chat_id in user_data['chats']),
+            return_exceptions=True)
+        for chat_id, chat in zip(user_data['chats'], chats):
             try:
-                chat = await context.bot.get_chat(chat_id)
+                if isinstance(chat, Exception):
+                    raise chat
                 chat_name = chat.title if chat.title else "Unknown"
                 manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
                 manual_allowed = chat_id in manual_ban_allowed
@@ -110,10 +199,16 @@ async def list_chats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
                     manual = "Отключено"
                 delete_status = user_data.get('delete_statuses', {}).get(str(chat_id), False)
                 status = "Включено" if delete_status else "Отключено"
-                chat_list += f"Название: {chat_name}\nИдентификатор: {chat_id}\nРучное удаление: {manual}\nУдаление статусов: {status}\n\n"
+                limit = user_data.get('emoji_limits', {}).get(str(chat_id), EMOJI_LIMIT)
+                chat_list += f"Название: {chat_name}\nИдентификатор: {chat_id}\nРучное удаление: {manual}\nУдаление статусов: {status}\nЛимит эмодзи: {limit}\n\n"
 
             except BadRequest:
                 chat_list += f"Недоступно: {chat_id} (Бот не имеет доступа к чату)\n"
+        digest_minutes = user_data.get('digest_minutes')
+        if digest_minutes:
+            chat_list += f"\nОтчёты о банах: сводка раз в {digest_minutes} мин."
+        else:
+            chat_list += "\nОтчёты о банах: по каждому бану"
         await update.message.reply_text(chat_list)
     else:
         await update.message.reply_text("У вас нет зарегистрированных чатов.")
@@ -136,18 +231,13 @@ async def allow_manual(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text('Неверный формат идентификатора чата. Используйте числовой ID.')
         return
     
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     if user_data and chat_id in user_data.get('chats', []):
         try:
-            chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
             if chat_member.status in ['creator', 'administrator']:
-                manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
-                manual_ban_allowed.add(chat_id)
-                
-                db_main.update(
-                    {'manual_ban_allowed': list(manual_ban_allowed)},
-                    User.user_id == user_id
-                )
+                user_data = await storage.set_manual_ban(user_id, chat_id, True)
+                owner_index.update_user(user_data)
                 await update.message.reply_text(f"Ручной бан разрешен для чата {chat_id}")
             else:
                 await update.message.reply_text('Вы не администратор этого чата.')
@@ -174,18 +264,15 @@ async def cancel_manual(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text('Неверный формат идентификатора чата. Используйте числовой ID.')
         return
     
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     if user_data and chat_id in user_data.get('chats', []):
         try:
-            chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
             if chat_member.status in ['creator', 'administrator']:
                 manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
                 if chat_id in manual_ban_allowed:
-                    manual_ban_allowed.remove(chat_id)
-                    db_main.update(
-                        {'manual_ban_allowed': list(manual_ban_allowed)},
-                        User.user_id == user_id
-                    )
+                    user_data = await storage.set_manual_ban(user_id, chat_id, False)
+                    owner_index.update_user(user_data)
                     await update.message.reply_text(f"Ручной бан запрещен для чата {chat_id}")
                 else:
                     await update.message.reply_text(f"Ручной бан уже был запрещен для чата {chat_id}")
@@ -201,7 +288,7 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user_id = update.effective_user.id
 
     # Check if manual banning is allowed for this chat
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = owner_index.get_user(user_id)
     if not user_data or chat_id not in user_data.get('manual_ban_allowed', []):
         await update.message.reply_text("Ручной бан не разрешен для этого чата.")
         return
@@ -216,9 +303,8 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     invoker = update.effective_user.id
 
     # Check if there's already an active vote for this message
-    for vote_info in ban_votes.values():
-        if vote_info['target_message_id'] == target_message_id:
-            return
+    if votes.for_target(chat_id, target_message_id) is not None:
+        return
 
     keyboard = [
         [
@@ -239,14 +325,9 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     )
 
     # Store voting information
-    ban_votes[f'{chat_id}_{ban_message.message_id}'] = {
-        'confirm': set([invoker]),
-        'cancel': set(),
-        'target_user_id': target_user.id,
-        'target_message_id': target_message_id,
-        'command_message_id': message_id,
-        'invoker': invoker
-    }
+    votes.add(Vote(chat_id, ban_message.message_id, target_message_id, target_user.id, message_id, invoker,
+                   update.message.reply_to_message.text or update.message.reply_to_message.caption,
+                   confirm=[invoker]))
 
 async def ban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
@@ -259,23 +340,22 @@ async def ban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    vote_key = f'{chat_id}_{query.message.message_id}'
+    vote = votes.get(chat_id, query.message.message_id)
 
-    if vote_key not in ban_votes:
+    if vote is None:
         await query.edit_message_text("Голосование завершено или недействительно.")
         return
 
-    vote_info = ban_votes[vote_key]
-
     # If user has already voted, ignore the new vote
-    if user_id in vote_info['confirm'] or user_id in vote_info['cancel']:
+    if user_id in vote.confirm or user_id in vote.cancel:
         return
 
     # Add user's vote to the chosen option
-    vote_info[action].add(user_id)
+    (vote.confirm if action == 'confirm' else vote.cancel).add(user_id)
+    votes.changed(vote)
 
-    confirm_count = len(vote_info['confirm'])
-    cancel_count = len(vote_info['cancel'])
+    confirm_count = len(vote.confirm)
+    cancel_count = len(vote.cancel)
 
     keyboard = [
         [
@@ -288,18 +368,25 @@ async def ban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await query.edit_message_reply_markup(reply_markup)
 
     if confirm_count >= 3 or cancel_count >= 3:
+        # Removed first, so a failed deletion below cannot leave the vote behind
+        votes.remove(vote)
         if confirm_count >= 3:
             try:
                 await context.bot.delete_message(chat_id, target_message_id)
                 await context.bot.ban_chat_member(chat_id, target_user_id)
             except BadRequest as e:
                 print(f"Ошибка при удалении: {e}")
+            if vote.target_text:
+                near_duplicates.add(vote.target_text, VOTE)
 
         # Delete the bot's message and the command message
-        await context.bot.delete_message(chat_id, query.message.message_id)
-        await context.bot.delete_message(chat_id, vote_info['command_message_id'])
+        await delete_vote_messages(context.bot, vote)
 
-        del ban_votes[vote_key]
+async def delete_vote_messages(bot, vote) -> None:
+    try:
+        await bot.delete_messages(vote.chat_id, [vote.vote_message_id, vote.command_message_id])
+    except BadRequest as e:
+        print(f"Не удалось удалить сообщения голосования в чате {vote.chat_id}: {e}")
 
 @private_chat_only
 async def delete_statuses(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -315,15 +402,13 @@ async def delete_statuses(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text('Неверный формат идентификатора чата. Используйте числовой ID.')
         return
     
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     if user_data and chat_id in user_data['chats']:
         try:
-            chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
             if chat_member.status in ['creator', 'administrator']:
-                if 'delete_statuses' not in user_data:
-                    user_data['delete_statuses'] = {}
-                user_data['delete_statuses'][str(chat_id)] = True
-                db_main.update(user_data, User.user_id == user_id)
+                user_data = await storage.set_delete_statuses(user_id, chat_id, True)
+                owner_index.update_user(user_data)
                 await update.message.reply_text(f'Автоматическое удаление статусов включено для чата {chat_id}')
             else:
                 await update.message.reply_text('Вы не администратор этого чата.')
@@ -346,14 +431,13 @@ async def allow_statuses(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text('Неверный формат идентификатора чата. Используйте числовой ID.')
         return
     
-    user_data = db_main.get(User.user_id == user_id)
+    user_data = await storage.get_user(user_id)
     if user_data and chat_id in user_data['chats']:
         try:
-            chat_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
             if chat_member.status in ['creator', 'administrator']:
-                if 'delete_statuses' in user_data:
-                    user_data['delete_statuses'][str(chat_id)] = False
-                db_main.update(user_data, User.user_id == user_id)
+                user_data = await storage.set_delete_statuses(user_id, chat_id, False)
+                owner_index.update_user(user_data)
                 await update.message.reply_text(f'Автоматическое удаление статусов отключено для чата {chat_id}')
             else:
                 await update.message.reply_text('Вы не администратор этого чата.')
@@ -362,6 +446,82 @@ async def allow_statuses(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     else:
         await update.message.reply_text('Чат не зарегистрирован.')
 
+@private_chat_only
+async def emoji_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+
+    if not context.args:
+        await update.message.reply_text('Добавьте идентификатор чата после команды.')
+        return
+
+    try:
+        chat_id = int(context.args[0])
+        limit = int(context.args[1]) if len(context.args) > 1 else None
+    except ValueError:
+        await update.message.reply_text('Неверный формат. Используйте: /emoji_limit <chat_id> <число>')
+        return
+    if limit is not None and not 1 <= limit <= MAX_EMOJI_LIMIT:
+        await update.message.reply_text(f'Лимит эмодзи должен быть от 1 до {MAX_EMOJI_LIMIT}.')
+        return
+
+    user_data = await storage.get_user(user_id)
+    if user_data and chat_id in user_data['chats']:
+        try:
+            chat_member = await chat_cache.get_chat_member(context.bot, chat_id, user_id)
+            if chat_member.status in ['creator', 'administrator']:
+                user_data = await storage.set_emoji_limit(user_id, chat_id, limit)
+                owner_index.update_user(user_data)
+                if limit is None:
+                    await update.message.reply_text(f'Для чата {chat_id} восстановлен лимит эмодзи по умолчанию ({EMOJI_LIMIT})')
+                else:
+                    await update.message.reply_text(f'Сообщения с более чем {limit} эмодзи в чате {chat_id} будут удаляться')
+            else:
+                await update.message.reply_text('Вы не администратор этого чата.')
+        except BadRequest:
+            await update.message.reply_text('Не удалось проверить права администратора. Убедитесь, что бот добавлен в чат.')
+    else:
+        await update.message.reply_text('Чат не зарегистрирован.')
+
+@private_chat_only
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+
+    try:
+        minutes = int(context.args[0]) if context.args else None
+    except ValueError:
+        await update.message.reply_text('Неверный формат. Используйте: /digest <минут>')
+        return
+    if minutes is not None and not 1 <= minutes <= MAX_DIGEST_MINUTES:
+        await update.message.reply_text(f'Период сводки должен быть от 1 до {MAX_DIGEST_MINUTES} минут.')
+        return
+
+    user_data = await storage.get_user(user_id)
+    if not user_data or not user_data['chats']:
+        await update.message.reply_text('У вас нет зарегистрированных чатов.')
+        return
+    user_data = await storage.set_digest(user_id, minutes)
+    owner_index.update_user(user_data)
+    if minutes is None:
+        await update.message.reply_text('Отчёт будет приходить по каждому автоматическому бану')
+    else:
+        await update.message.reply_text(f'Отчёты об автоматических банах будут приходить одной сводкой раз в {minutes} мин.')
+
+@private_chat_only
+async def reload_rules(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text('Команда доступна только администраторам бота.')
+        return
+
+    try:
+        registry, elapsed, changed = await rule_reloader.reload()
+    except (OSError, ValueError) as e:
+        await update.message.reply_text(f'Правила не обновлены, работают прежние: {e}')
+        return
+    if changed:
+        await update.message.reply_text(f'Правила обновлены до версии {registry.version} за {elapsed * 1000:.0f} мс')
+    else:
+        await update.message.reply_text(f'Правила не изменились (версия {registry.version})')
+
 async def handle_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user.is_bot:  # Ignore messages from bots
         return
@@ -369,19 +529,26 @@ async def handle_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     chat_id = update.effective_chat.id
     
     # Check if this chat is registered by any user
-    registered_users = db_main.search(User.chats.any([chat_id]))
-    
-    for user_data in registered_users:
-        delete_status = user_data.get('delete_statuses', {}).get(str(chat_id), False)
-        if delete_status:
-            try:
-                await update.effective_message.delete()
-                
-            except BadRequest as e:
-                print(f"Не удалось удалить статус в чате {chat_id}: {str(e)}")
-            
-            # Break after first successful deletion to avoid multiple attempts
-            break
+    with phase_seconds.time("handle_status"):
+        for owner in owner_index.owners(chat_id):
+            if owner.delete_statuses:
+                try:
+                    await update.effective_message.delete()
+
+                except BadRequest as e:
+                    print(f"Не удалось удалить статус в чате {chat_id}: {str(e)}")
+
+                # Break after first successful deletion to avoid multiple attempts
+                break
+
+async def track_chat_changes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Drop cached chat data as soon as Telegram reports that it changed
+    if update.my_chat_member:
+        chat_cache.invalidate_chat(update.my_chat_member.chat.id)
+    elif update.chat_member:
+        chat_cache.invalidate_member(update.chat_member.chat.id, update.chat_member.new_chat_member.user.id)
+    elif update.effective_chat:
+        chat_cache.invalidate_chat(update.effective_chat.id)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     help_text = """
@@ -395,6 +562,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 /ban - Запустить голосование среди участников чата за удаление сообщения
 /delete_statuses <chat_id> - Включить автоматическое удаление статусов (по умолчанию выключено)
 /allow_statuses <chat_id> - Отключить автоматическое удаление статусов
+/emoji_limit <chat_id> <число> - Удалять сообщения, в которых эмодзи больше этого числа (по умолчанию 12). Без числа — вернуть значение по умолчанию
+/digest <минут> - Присылать отчёты об автоматических банах одной сводкой за этот период. Без числа — отчёт по каждому бану
 /help - Показать справку
 """
     await update.message.reply_text(help_text)
@@ -402,6 +571,54 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def check_automatically(update: Update, context: CallbackContext):
     message = update.message
     chat_id = update.effective_chat.id
+
+    # Most traffic comes from chats nobody has registered, skip it before any text analysis
+    with phase_seconds.time("owners"):
+        owners = owner_index.owners(chat_id)
+    if not owners:
+        unregistered_messages.increment()
+        bot_metrics.messages.inc("unregistered")
+        return
+
+    if message.text is None and message.caption is None:
+        bot_metrics.messages.inc("no_text")
+        return
+
+    with phase_seconds.time("extract"):
+        words = NormalizedMessage(message.text or message.caption)
+        is_reply = message.reply_to_message is not None
+        # With several owners the strictest limit applies
+        limit = min((owner.emoji_limit for owner in owners if owner.emoji_limit is not None), default=EMOJI_LIMIT)
+    with phase_seconds.time("classify"):
+        classification = await verdict_cache.classify_with(classification_executor, words, is_reply=is_reply,
+                                                           emoji_limit=limit)
+	 
+    # Ban automatically
+    # todo: add repeated emojis check
+    if not classification.is_spam:
+        bot_metrics.messages.inc("ham")
+        return
+    bot_metrics.messages.inc("spam")
+    bot_metrics.spam.inc(classification.decided_by, classification.category or "")
+
+    # Moderation comes first: the spam stays visible until both calls return
+    with phase_seconds.time("remove_spam"):
+        errors = await remove_spam(context.bot, message.chat_id, message.message_id, message.from_user.id)
+    near_duplicates.add(words)
+
+    # The report goes to the first owner of the chat, off the critical path
+    owner = owners[0]
+    if owner.digest_minutes and not digests.add(context.bot, owner.user_id, owner.digest_minutes,
+                                                message, classification, errors):
+        return
+    notifications.submit(owner.user_id, lambda: report_ban(context.bot, owner.user_id, message, classification, errors))
+
+async def report_ban(bot, owner_id, message, classification, errors) -> None:
+    with phase_seconds.time("report"):
+        await send_report(bot, owner_id, message, classification, errors)
+
+async def send_report(bot, owner_id, message, classification, errors) -> None:
+    chat_id = message.chat_id
     from_user = message.from_user
     if from_user.last_name is not None:
         user_display_name = f"{from_user.first_name} {from_user.last_name}"
@@ -411,99 +628,93 @@ async def check_automatically(update: Update, context: CallbackContext):
 
     str_chat_id = str(chat_id).replace("-100", "")
     link = f"https://t.me/c/{str_chat_id}"
-    
-    if message.text is None and message.caption is None:
-        return
-
-    words = message.text or message.caption
-    
-    mixed_words = has_mixed_words(words)
-    num_mixed = len(mixed_words)
-    
-    spam_tokens = new_is_spam_message(words)
-    crit_tokens = has_critical_patterns(words)
-    crit_tokens_bool = crit_tokens is not None
-    if crit_tokens:
-        crit_tokens_string = crit_tokens.group()
-    else: crit_tokens_string = None
-    
-    emoji_num = sum(1 for _ in emoji.emoji_list(words))
-    if emoji_num > 12:
-        emoji_critical_num = True
-    else:
-        emoji_critical_num = False
 
-    is_reply = message.reply_to_message is not None
-	 
-    for user in db_main.all():
-        if chat_id in user['chats']:
-            try:
-                chat = await context.bot.get_chat(chat_id)
-                chat_title = chat.title if chat.title else f"Chat {chat_id}"
-
-                # Ban automatically
-                # todo: add repeated emojis check
-
-                if (len(words) < 500 and is_reply is False) and (("✅✅✅✅" in words or "✅✅✅✅" in words.replace('\U0001F537', '✅') or (crit_tokens_bool is True ) or num_mixed > 1 or spam_tokens is not None or emoji_critical_num is True)):
-                    verdict = f"""
-<b>Основное регулярное выражению:</b> {spam_tokens is not None}
-<b>Критические токены:</b> {crit_tokens_bool} | {crit_tokens_string}
-<b>Смешанные слова:</b> {num_mixed}; [ {', '.join(mixed_words)} ]
-<b>Более 12 эмодзи:</b> {emoji_critical_num}
+    try:
+        with phase_seconds.time("get_chat"):
+            chat = await chat_cache.get_chat(bot, chat_id)
+        chat_title = chat.title if chat.title else f"Chat {chat_id}"
+    except TelegramError as e:
+        print(f"Ошибка при обработке сообщения: {str(e)}")
+        chat_title = message.chat.title or f"Chat {chat_id}"
+
+    crit_tokens = classification.crit_match
+    crit_tokens_string = crit_tokens.group() if crit_tokens else None
+    crit_category = classification.registry.category(crit_tokens)
+    spam_category = classification.registry.category(classification.spam_match)
+    mixed_words = classification.mixed_words
+    confusable_words = classification["confusables"]
+    # Checked only when it decided: the text itself is in the index by now
+    duplicate_line = ""
+    if classification.decided_by == "near_duplicate":
+        duplicate = classification.near_duplicate
+        source = "голосованием" if duplicate.source == VOTE else "автоматически"
+        duplicate_line = f"<b>Копия текста, удалённого {source}:</b> сходство {duplicate.similarity:.0%}\n"
+    verdict = f"""
+{duplicate_line}<b>Основное регулярное выражению:</b> {classification.spam_match is not None}{f' ({spam_category})' if spam_category else ''}
+<b>Критические токены:</b> {crit_tokens is not None} | {crit_tokens_string}{f' ({crit_category})' if crit_category else ''}
+<b>Смешанные слова:</b> {len(mixed_words)}; [ {', '.join(mixed_words)} ]
+<b>Цифры вместо букв:</b> {len(confusable_words)}; [ {', '.join(confusable_words)} ]
+<b>Более {classification.emoji_limit} эмодзи:</b> {classification.emoji_critical}
             """
-                    if message.text is not None:
-                        message_text = message.text_html_urled
-                        text_message_content = f"🎯 <b>Автоматический бан:</b>\n\n👤 <a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
-
-                        try:
-                            await context.bot.delete_message(chat_id=message.chat_id, message_id=message.message_id)
-                            await context.bot.ban_chat_member(chat_id=message.chat_id, user_id=message.from_user.id)
-                            await context.bot.send_message(chat_id=user['user_id'],
-                                text=text_message_content,
-                                disable_web_page_preview=True,
-                                parse_mode="HTML")
-                            return
-
-                        except TelegramError as e:
-                            error_message = f"Возникла ошибка при автоматическом бане: {str(e)}\n\n<a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
-                            await context.bot.send_message(chat_id=user['user_id'],
-                                text=error_message,
-                                disable_web_page_preview=True,
-                                parse_mode="HTML")
-                
-                            return
-
-                    elif message.text is None:
-                        message_text = message.caption_html_urled
-                        message_content = f"🎯 <b>Автоматический бан:</b>\n\n👤 <a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
-            
-                        try:
-                            await context.bot.ban_chat_member(chat_id=message.chat_id, user_id=message.from_user.id)
-                            await context.bot.copy_message(chat_id=user['user_id'],
-                                from_chat_id=message.chat_id,
-                                message_id=message.message_id,
-                                caption=message_content,
-                                parse_mode="HTML")
-                            await context.bot.delete_message(chat_id=message.chat_id, message_id=message.message_id)
-
-                            return
-
-                        except TelegramError as e:
-                            error_message = f"Возникла ошибка при автоматическом бане: {str(e)}\n\n<a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
-                            await context.bot.copy_message(chat_id=user['user_id'],
-                                from_chat_id=message.chat_id,
-                                message_id=message.message_id,
-                                caption=error_message,
-                                parse_mode="HTML")
-                            return
-            except TelegramError as e:
-                print(f"Ошибка при обработке сообщения: {str(e)}")
-        else:
-            print(f"{message}")
+
+    if errors:
+        error_text = "; ".join(f"{action}: {str(e)}" for action, e in errors.items())
+        header = f"Возникла ошибка при автоматическом бане: {error_text}\n\n"
+    else:
+        header = "🎯 <b>Автоматический бан:</b>\n\n👤 "
+
+    if message.text is not None:
+        message_text = message.text_html_urled
+        text_message_content = f"{header}<a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
+        await bot.send_message(chat_id=owner_id,
+            text=text_message_content,
+            disable_web_page_preview=True,
+            parse_mode="HTML",
+            rate_limit_args=REPORT)
+    else:
+        # The original is already deleted, so the media is re-sent by file_id
+        message_text = message.caption_html_urled
+        message_content = f"{header}<a href='{user_link}'><b>{user_display_name}</b></a> из чата <a href='{link}'>{chat_title}</a>\n\n{message_text}\n{verdict}"
+        await send_media_copy(bot, owner_id, message, message_content, rate_limit_args=REPORT)
+
+async def post_init(application: Application) -> None:
+    rule_reloader.start()
+    votes.start(lambda vote: delete_vote_messages(application.bot, vote))
+    if metrics_server is not None:
+        await metrics_server.start()
+
+async def post_stop(application: Application) -> None:
+    # The bot can still send here: open digests and queued reports go out before it shuts down
+    digests.flush(application.bot)
+    await notifications.drain(SHUTDOWN_REPORT_TIMEOUT)
+
+async def post_shutdown(application: Application) -> None:
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await rule_reloader.stop()
+    await votes.stop()
+    await notifications.stop()
+    await storage.close()
+    classification_executor.shutdown()
+
+# Update types the handlers registered in main() consume; Telegram does not send the others at all
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER]
 
 def main() -> None:
+    # Forked before the application starts any thread
+    classification_executor.start()
     print("I'm working")
-    application = Application.builder().token(TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .request(InstrumentedRequest())
+        .rate_limiter(outbound)
+        .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES, on_wait=bot_metrics.update_wait_seconds.observe))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -512,15 +723,25 @@ def main() -> None:
     application.add_handler(CommandHandler("list", list_chats))
     application.add_handler(CommandHandler("delete_statuses", delete_statuses))
     application.add_handler(CommandHandler("allow_statuses", allow_statuses))
+    application.add_handler(CommandHandler("emoji_limit", emoji_limit))
+    application.add_handler(CommandHandler("digest", digest_command))
     application.add_handler(CommandHandler("ban", ban_command))
     application.add_handler(CommandHandler("allow_manual", allow_manual))
     application.add_handler(CommandHandler("cancel_manual", cancel_manual))
+    application.add_handler(CommandHandler("reload_rules", reload_rules))
     application.add_handler(CallbackQueryHandler(ban_callback, pattern='^ban_'))
 
     application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND & ~filters.STORY & ~filters.StatusUpdate.ALL, check_automatically), group=0)
     application.add_handler(MessageHandler(filters.StatusUpdate.ALL, handle_status), group=1)
+    application.add_handler(ChatMemberHandler(track_chat_changes, ChatMemberHandler.ANY_CHAT_MEMBER), group=2)
+    application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_TITLE | filters.StatusUpdate.NEW_CHAT_PHOTO | filters.StatusUpdate.DELETE_CHAT_PHOTO, track_chat_changes), group=2)
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        application.run_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH,
+                                webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET,
+                                allowed_updates=ALLOWED_UPDATES)
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
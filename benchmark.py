@@ -0,0 +1,202 @@
+"""Offline benchmark of the spam classifier over a labelled corpus.
+
+    python benchmark.py                                # print the report
+    python benchmark.py --output results.json          # also save it
+    python benchmark.py --compare results.json         # diff against a saved run
+
+Corpus lines are JSON objects: {"label": "spam" | "ham", "kind": "...", "text": "..."}.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from classifier import EMOJI_LIMIT, GATE, SIGNAL, classifier
+from is_spam_message import (get_registry, has_confusable_words, has_critical_patterns, new_is_spam_message,
+                             has_mixed_words)
+from normalization import NormalizedMessage
+
+DEFAULT_CORPUS = "corpus/messages.jsonl"
+
+# Every function gets the raw text, so each timing includes building its NormalizedMessage
+FUNCTIONS = {
+    "has_critical_patterns": has_critical_patterns,
+    "new_is_spam_message": new_is_spam_message,
+    "has_mixed_words": has_mixed_words,
+    "has_confusable_words": has_confusable_words,
+    "emoji_count": lambda text: NormalizedMessage(text).count_emoji(EMOJI_LIMIT + 1),
+    "classify": lambda text: classifier.classify(text).is_spam,
+}
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_function(function, texts, repeat):
+    """Per-message latencies in microseconds; each message keeps its fastest run."""
+    latencies = []
+    for text in texts:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            function(text)
+            elapsed = time.perf_counter_ns() - start
+            best = elapsed if best is None else min(best, elapsed)
+        latencies.append(best / 1000)
+    total_seconds = sum(latencies) / 1_000_000
+    return {
+        "p50_us": round(percentile(latencies, 0.50), 1),
+        "p99_us": round(percentile(latencies, 0.99), 1),
+        "max_us": round(max(latencies), 1),
+        "messages_per_sec": round(len(texts) / total_seconds) if total_seconds else None,
+    }
+
+
+def quality(messages):
+    tp = fp = fn = tn = 0
+    misclassified = []
+    for message in messages:
+        is_spam = classifier.classify(message["text"]).is_spam
+        expected = message["label"] == "spam"
+        if is_spam and expected:
+            tp += 1
+        elif is_spam:
+            fp += 1
+        elif expected:
+            fn += 1
+        else:
+            tn += 1
+        if is_spam != expected:
+            misclassified.append({"label": message["label"], "kind": message.get("kind"),
+                                  "text": message["text"][:80]})
+    return {
+        "true_positives": tp, "false_positives": fp, "false_negatives": fn, "true_negatives": tn,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "misclassified": misclassified,
+    }
+
+
+def signal_quality(messages):
+    """Precision and recall of every signal stage on its own, on the messages no gate excludes."""
+    gates = [stage for stage in classifier.stages if stage.kind == GATE]
+    signals = [stage for stage in classifier.stages if stage.kind == SIGNAL]
+    counts = {stage.name: [0, 0] for stage in signals}
+    spam = 0
+    for message in messages:
+        verdict = classifier.classify(message["text"])
+        if any(stage.decides(verdict[stage.name]) for stage in gates):
+            continue
+        expected = message["label"] == "spam"
+        spam += expected
+        for stage in signals:
+            if stage.decides(verdict[stage.name]):
+                counts[stage.name][0 if expected else 1] += 1
+    return {
+        name: {"true_positives": tp, "false_positives": fp,
+               "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+               "recall": round(tp / spam, 4) if spam else None}
+        for name, (tp, fp) in counts.items()
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(corpus_path, repeat):
+    messages = load_corpus(corpus_path)
+    texts = [message["text"] for message in messages]
+    return {
+        "revision": git_revision(),
+        "rules_version": get_registry().version,
+        "python": platform.python_version(),
+        "corpus": corpus_path,
+        "messages": len(messages),
+        "repeat": repeat,
+        "functions": {name: time_function(function, texts, repeat) for name, function in FUNCTIONS.items()},
+        "quality": quality(messages),
+        "signals": signal_quality(messages),
+    }
+
+
+def print_report(results):
+    print(f"Ревизия {results['revision']}, правила {results['rules_version']}, "
+          f"{results['messages']} сообщений, Python {results['python']}")
+    print(f"{'функция':<24}{'p50, мкс':>12}{'p99, мкс':>12}{'max, мкс':>12}{'сообщ./с':>12}")
+    for name, stats in results["functions"].items():
+        print(f"{name:<24}{stats['p50_us']:>12}{stats['p99_us']:>12}{stats['max_us']:>12}"
+              f"{stats['messages_per_sec']:>12}")
+    q = results["quality"]
+    print(f"precision {q['precision']}, recall {q['recall']} "
+          f"(TP {q['true_positives']}, FP {q['false_positives']}, FN {q['false_negatives']}, TN {q['true_negatives']})")
+    for message in q["misclassified"]:
+        print(f"  ошибка [{message['label']}/{message['kind']}]: {message['text']!r}")
+    print("Признаки по отдельности:")
+    for name, stats in results["signals"].items():
+        print(f"  {name:<22}precision {stats['precision']}, recall {stats['recall']} "
+              f"(TP {stats['true_positives']}, FP {stats['false_positives']})")
+
+
+def compare(results, baseline, tolerance, min_delta_us):
+    """Print the differences to a saved run; returns False when p99 latency or quality regressed."""
+    ok = True
+    print(f"\nСравнение с ревизией {baseline.get('revision')}:")
+    for name, stats in results["functions"].items():
+        before = baseline["functions"].get(name)
+        if before is None:
+            continue
+        ratio = stats["p99_us"] / before["p99_us"] if before["p99_us"] else 1.0
+        flag = ""
+        if ratio > tolerance and stats["p99_us"] - before["p99_us"] > min_delta_us:
+            flag = "  <-- регрессия"
+            ok = False
+        print(f"{name:<24}p99 {before['p99_us']} -> {stats['p99_us']} мкс (x{ratio:.2f}){flag}")
+    for key in ("precision", "recall"):
+        before, after = baseline["quality"][key], results["quality"][key]
+        flag = ""
+        if before is not None and (after is None or after < before):
+            flag = "  <-- регрессия"
+            ok = False
+        print(f"{key:<24}{before} -> {after}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the spam classifier")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per message, the fastest is kept")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed p99 slowdown against --compare before the run fails")
+    parser.add_argument("--min-delta-us", type=float, default=100.0,
+                        help="p99 differences smaller than this are treated as noise")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(results, baseline, args.tolerance, args.min_delta_us):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Metrics of the running bot, collected in one registry that MetricsServer serves."""
+import time
+from telegram.request import HTTPXRequest
+from metrics import MetricsRegistry
+
+registry = MetricsRegistry()
+
+messages = registry.counter("antispam_messages_total", "Messages seen by the automatic check, by outcome",
+                            ("result",))
+spam = registry.counter("antispam_spam_total", "Messages removed automatically, by deciding stage and rule category",
+                        ("stage", "category"))
+phase_seconds = registry.histogram("antispam_phase_seconds", "Time of each phase of update handling", ("phase",))
+stage_seconds = registry.histogram("antispam_stage_seconds", "Time of each classifier stage", ("stage",))
+update_wait_seconds = registry.histogram("antispam_update_wait_seconds",
+                                         "Time an update waited for its chat and a free slot")
+api_seconds = registry.histogram("antispam_bot_api_seconds", "Bot API request time, by method", ("method",))
+api_errors = registry.counter("antispam_bot_api_errors_total",
+                              "Failed Bot API requests, by method and HTTP status or exception", ("method", "reason"))
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """The default Bot API transport, timing every request and counting the failed ones."""
+
+    def __init__(self, connection_pool_size=256, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        # The URL ends in the method name; the token before it must not become a label
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            api_errors.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - started, api_method)
+        if code != 200:
+            api_errors.inc(api_method, str(code))
+        return code, payload
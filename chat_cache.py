@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache whose entries also expire ttl seconds after they were stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ChatInfoCache:
+    """Caches Bot API chat metadata and member statuses shared by all handlers.
+
+    Concurrent misses for the same key share one request. Failed requests are not
+    cached. Entries are dropped early through invalidate_chat / invalidate_member when
+    Telegram reports a change.
+    """
+
+    def __init__(self, chat_ttl=600, member_ttl=60, maxsize=2048):
+        self._chats = TTLCache(maxsize, chat_ttl)
+        self._members = TTLCache(maxsize, member_ttl)
+        self._pending = {}
+
+    async def _fetch(self, cache, key, request):
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._pending[key] = task
+            task.add_done_callback(lambda done: self._store(cache, key, done))
+        # A cancelled caller must not cancel the request other callers are waiting on
+        return await asyncio.shield(task)
+
+    def _store(self, cache, key, task):
+        # An invalidation while the request was in flight drops it from _pending
+        if self._pending.get(key) is not task:
+            return
+        del self._pending[key]
+        if not task.cancelled() and task.exception() is None:
+            cache.set(key, task.result())
+
+    async def get_chat(self, bot, chat_id):
+        return await self._fetch(self._chats, ('chat', chat_id), lambda: bot.get_chat(chat_id))
+
+    async def get_chat_member(self, bot, chat_id, user_id):
+        return await self._fetch(self._members, ('member', chat_id, user_id),
+                                 lambda: bot.get_chat_member(chat_id=chat_id, user_id=user_id))
+
+    def invalidate_chat(self, chat_id):
+        self._chats.pop(('chat', chat_id))
+        self._members.pop_where(lambda key: key[1] == chat_id)
+        for key in [key for key in self._pending if key[1] == chat_id]:
+            del self._pending[key]
+
+    def invalidate_member(self, chat_id, user_id):
+        self._members.pop(('member', chat_id, user_id))
+        self._pending.pop(('member', chat_id, user_id), None)
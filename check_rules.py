@@ -0,0 +1,103 @@
+"""Checks that the compiled rule sets match exactly what the plain regexes match.
+
+The registry does not run the phrase lists as written: regex rules run only when the
+prefilter finds one of their anchors, and co-occurrence rules are evaluated over the
+message's words. Both are derived from the phrases, so a rule edit can break them
+silently. This compares them with the original matcher over the corpus and over
+random texts built from the rules' own words with mixed case and separators: every
+phrase searched on its own, the leftmost match winning and ties going to the earlier
+phrase, the same as one case-insensitive alternation per list. Whether a list matches
+must agree; the matched text must agree among the regex rules, which the registry
+tries before the co-occurrence rules.
+
+    python check_rules.py                  # exit 1 when any text is judged differently
+    python check_rules.py --count 100000 --seed 7
+"""
+import argparse
+import random
+import re
+import sys
+from benchmark import DEFAULT_CORPUS, load_corpus
+from is_spam_message import _compile_rule, get_registry, parse_cooccurrence_rule
+
+FILLER = ["привет", "как", "дела", "работа", "деньги", "пиши", "лс", "ЛС", "18+", "+", "$", "100$", "2024",
+          "документация", "API", "markdown", "İ", "ſ", "ё", "Ё", "!", "?", ".", ","]
+SEPARATORS = [" ", " ", " ", "  ", "\n", "\t", " ", ", ", ". ", "_", "-", ""]
+
+
+class Reference:
+    """The original matcher of a phrase list."""
+
+    def __init__(self, phrases):
+        self.patterns = [(_compile_rule(phrase), parse_cooccurrence_rule(phrase) is None) for phrase in phrases]
+
+    def search(self, text, regex_only=False):
+        best = None
+        for pattern, is_regex in self.patterns:
+            if regex_only and not is_regex:
+                continue
+            match = pattern.search(text)
+            if match and (best is None or match.start() < best.start()):
+                best = match
+        return best
+
+
+def random_texts(registry, count, seed):
+    words = set()
+    for phrase in registry.crit_phrases + registry.main_phrases + registry.supporting_phrases:
+        # Escapes such as \b and \s are not words of the phrase
+        words.update(re.findall(r"[^\W\d_]{2,}|\d+", re.sub(r"\\.", " ", phrase)))
+    pool = sorted(words) + FILLER
+    generator = random.Random(seed)
+    for _ in range(count):
+        parts = [generator.choice(pool) for _ in range(generator.randint(1, 25))]
+        if generator.random() < 0.3:
+            parts = [part.upper() if generator.random() < 0.3 else part for part in parts]
+        yield "".join(part + generator.choice(SEPARATORS) for part in parts)
+
+
+def differences(registry, text, crit, main, supporting):
+    """What the registry judges differently from the original matcher."""
+    found = []
+    expected = crit.search(text)
+    actual = registry.has_critical_patterns(text)
+    if (expected is not None) != (actual is not None):
+        found.append(f"critical: {expected is not None} -> {actual is not None}")
+    elif isinstance(actual, re.Match):
+        expected = crit.search(text, regex_only=True)
+        if expected is None or actual.group() != expected.group():
+            found.append(f"critical: {expected and expected.group()!r} -> {actual.group()!r}")
+    expected = bool(main.search(text) and supporting.search(text))
+    actual = registry.new_is_spam_message(text) is not None
+    if expected != actual:
+        found.append(f"spam_phrases: {expected} -> {actual}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compiled rule sets with the plain regexes")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--count", type=int, default=5000, help="random texts to generate")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    registry = get_registry()
+    crit = Reference(registry.crit_phrases)
+    main_ = Reference(registry.main_phrases)
+    supporting = Reference(registry.supporting_phrases)
+    texts = [message["text"] for message in load_corpus(args.corpus)]
+    texts += random_texts(registry, args.count, args.seed)
+
+    mismatches = 0
+    for text in texts:
+        found = differences(registry, text, crit, main_, supporting)
+        if found:
+            mismatches += 1
+            if mismatches <= 20:
+                print(f"  {text[:120]!r}: {'; '.join(found)}")
+    print(f"Правила {registry.version}: текстов {len(texts)}, расхождений {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
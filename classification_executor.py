@@ -0,0 +1,112 @@
+"""Classification of long texts in worker processes, so the regexes never stall the event loop.
+
+Short texts and replies are classified inline: below offload_length a classification
+takes less than sending the text to another process. For longer texts the stages that
+run the rules (mixed words, confusables, critical phrases, spam phrases, emoji) are computed by a
+worker, and the Verdict is built in the bot's process from their results; the
+near-duplicate stage needs the index and stays local. Workers keep the compiled rules
+of their own and reload them when the bot's version differs. When no worker
+answers within timeout, because the text is slow or the workers are busy, only the
+cheap stages run (the gates, checkmarks and near-duplicates): running the rules inline
+would put the very text that was too slow for a worker on the event loop.
+
+Why texts from 200 characters: a round trip to a worker costs about 0.4 ms, and
+profile_rules.py lets a rule take up to 20 ms on 2000 characters. A rule at that budget
+that is quadratic costs 20 ms * (200 / 2000)^2 = 0.2 ms at 200 characters, less than
+the round trip, so shorter texts are not worth sending; at 499 it costs up to 1.25 ms.
+With the shipped rules the slowest generated 499 character text takes about 0.36 ms in
+total, so the workers only pay off once a rule backtracks.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from classifier import DEFAULT_STAGES, MAX_MESSAGE_LENGTH, Classifier
+from is_spam_message import detach_match, get_registry, load_registry, set_registry
+from normalization import normalize
+
+logger = logging.getLogger(__name__)
+
+OFFLOADED_STAGES = ("mixed_words", "confusables", "critical", "spam_phrases", "emoji")
+# Results of the offloaded stages for a text no worker classified in time: none of them fired
+TIMED_OUT_RESULTS = {"mixed_words": [], "confusables": [], "critical": None, "spam_phrases": None, "emoji": False}
+
+_worker_classifier = Classifier(DEFAULT_STAGES)
+
+
+def _compute_stages(text, emoji_limit, version):
+    """Run in a worker: the offloaded stage results and every mixed word, or None when the rules differ."""
+    if get_registry().version != version:
+        set_registry(load_registry())
+        if get_registry().version != version:
+            return None
+    verdict = _worker_classifier.classify(text, emoji_limit=emoji_limit)
+    results = {name: verdict[name] for name in OFFLOADED_STAGES}
+    results["critical"] = detach_match(results["critical"])
+    results["spam_phrases"] = detach_match(results["spam_phrases"])
+    return results, verdict.mixed_words
+
+
+def _ready():
+    return get_registry().version
+
+
+class ClassificationExecutor:
+    def __init__(self, classifier, workers, offload_length=200, timeout=2.0):
+        self.classifier = classifier
+        self.workers = workers
+        self.offload_length = offload_length
+        self.timeout = timeout
+        self.offloaded = 0
+        self.timeouts = 0
+        self._pool = None
+
+    def start(self):
+        """Start the workers and wait until they are ready.
+
+        Call it before the bot starts its threads: workers are forked where the
+        platform allows, and inherit the compiled rules.
+        """
+        if self.workers <= 0:
+            return
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork") if "fork" in methods else None
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        for future in [self._pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def classify(self, message, is_reply, emoji_limit):
+        message = normalize(message)
+        # Replies and texts over the length gate are settled before any rule runs
+        if (self._pool is None or is_reply or len(message) < self.offload_length
+                or len(message) >= MAX_MESSAGE_LENGTH):
+            return self.classifier.classify(message, is_reply, emoji_limit)
+        self.offloaded += 1
+        try:
+            computed = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(
+                    self._pool, _compute_stages, message.text, emoji_limit, get_registry().version),
+                self.timeout)
+        except asyncio.TimeoutError:
+            # The worker keeps running until the regexes finish; the gate bounds how long
+            self.timeouts += 1
+            logger.warning("Classification of a %d character text timed out, checked by the cheap stages only",
+                           len(message))
+            verdict = self.classifier.classify(message, is_reply, emoji_limit, TIMED_OUT_RESULTS, [])
+            verdict.timed_out = True
+            return verdict
+        except BrokenProcessPool:
+            logger.exception("Classification workers failed, classifying inline")
+            self._pool = None
+            return self.classifier.classify(message, is_reply, emoji_limit)
+        if computed is None:
+            # The rule files changed and the bot has not reloaded them yet
+            return self.classifier.classify(message, is_reply, emoji_limit)
+        results, mixed_words = computed
+        return self.classifier.classify(message, is_reply, emoji_limit, results, mixed_words)
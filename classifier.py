@@ -0,0 +1,213 @@
+import time
+from chat_cache import TTLCache
+from is_spam_message import get_registry
+from near_duplicates import NearDuplicateIndex
+from normalization import normalize
+
+# Messages this long, and replies, are never banned automatically
+MAX_MESSAGE_LENGTH = 500
+EMOJI_LIMIT = 12
+MIN_MIXED_WORDS = 2
+# Runs of ✅ / 🔷 at least this long are spam
+CHECKMARK_RUN = 4
+
+GATE = "gate"
+SIGNAL = "signal"
+
+
+class Stage:
+    """One step of the pipeline.
+
+    decides() returns True when the stage settles the verdict: "not spam" for a gate,
+    "spam" for a signal. Cost is a relative estimate used only to order the stages.
+    """
+
+    __slots__ = ("name", "kind", "cost", "compute", "decides")
+
+    def __init__(self, name, kind, cost, compute, decides):
+        self.name = name
+        self.kind = kind
+        self.cost = cost
+        self.compute = compute
+        self.decides = decides
+
+
+class Verdict:
+    """Result of a classification. Stages skipped by the short-circuit run on first access.
+
+    results holds stage results computed elsewhere, such as in a worker process;
+    those stages are not run again.
+    """
+
+    def __init__(self, classifier, message, is_reply, emoji_limit, results=None, mixed_words=None):
+        self.message = message
+        self.text = message.text
+        self.is_reply = is_reply
+        self.emoji_limit = emoji_limit
+        self.registry = get_registry()
+        self.decided_by = None
+        self._classifier = classifier
+        self._results = dict(results) if results else {}
+        self._mixed_words = mixed_words
+        # Set when the rule stages did not run in time and were taken as not fired
+        self.timed_out = False
+        self.is_spam = self._evaluate()
+
+    def _evaluate(self):
+        for stage in self._classifier.stages:
+            if stage.decides(self[stage.name]):
+                self.decided_by = stage.name
+                return stage.kind == SIGNAL
+        return False
+
+    def __getitem__(self, name):
+        if name not in self._results:
+            stage = self._classifier.stage(name)
+            observe = self._classifier.observe
+            if observe is None:
+                self._results[name] = stage.compute(self)
+            else:
+                started = time.perf_counter()
+                self._results[name] = stage.compute(self)
+                observe(name, time.perf_counter() - started)
+        return self._results[name]
+
+    @property
+    def crit_match(self):
+        return self["critical"]
+
+    @property
+    def spam_match(self):
+        return self["spam_phrases"]
+
+    @property
+    def mixed_words(self):
+        # The stage stops counting at MIN_MIXED_WORDS; reports list every word
+        if self._mixed_words is None:
+            self._mixed_words = self.registry.has_mixed_words(self.message)
+        return self._mixed_words
+
+    @property
+    def emoji_critical(self):
+        return self["emoji"]
+
+    @property
+    def category(self):
+        """Category of the phrase rule that made the verdict, when one did."""
+        if self.decided_by == "critical":
+            return self.registry.category(self.crit_match)
+        if self.decided_by == "spam_phrases":
+            return self.registry.category(self.spam_match)
+        return None
+
+    @property
+    def near_duplicate(self):
+        return self["near_duplicate"]
+
+    def find_duplicate(self):
+        duplicates = self._classifier.duplicates
+        return duplicates.find(self.message) if duplicates is not None else None
+
+
+class Classifier:
+    """Runs the stages cheapest first; duplicates is the index of recently banned texts.
+
+    When observe is set, it is called with the name and duration in seconds of every
+    stage that runs.
+    """
+
+    def __init__(self, stages, duplicates=None, observe=None):
+        self.stages = sorted(stages, key=lambda stage: stage.cost)
+        self.duplicates = duplicates
+        self.observe = observe
+        self._by_name = {stage.name: stage for stage in self.stages}
+
+    def stage(self, name):
+        return self._by_name[name]
+
+    def classify(self, message, is_reply=False, emoji_limit=EMOJI_LIMIT, results=None, mixed_words=None):
+        """Classify a text or a NormalizedMessage. More than emoji_limit emoji is spam."""
+        return Verdict(self, normalize(message), is_reply, emoji_limit, results, mixed_words)
+
+
+class VerdictCache:
+    """Recent verdicts by message text, so a spam wave posted across many chats is classified once.
+
+    A verdict depends only on the text, is_reply, the emoji limit and the rules, so
+    those make up the key. All entries are dropped when the rules change. A "not spam"
+    verdict is also stale once a text has been banned since, as the message may be a
+    copy of it.
+    """
+
+    def __init__(self, classifier, maxsize=10000, ttl=600):
+        self._classifier = classifier
+        self._entries = TTLCache(maxsize, ttl)
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, message, is_reply, emoji_limit):
+        version = get_registry().version
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        key = (message.digest, is_reply, emoji_limit)
+        duplicates = self._classifier.duplicates
+        banned = duplicates.version if duplicates is not None else None
+        entry = self._entries.get(key)
+        if entry is not None and (entry[0].is_spam or entry[1] == banned):
+            self.hits += 1
+            return key, banned, entry[0]
+        self.misses += 1
+        return key, banned, None
+
+    def classify(self, message, is_reply=False, emoji_limit=EMOJI_LIMIT):
+        message = normalize(message)
+        key, banned, verdict = self._lookup(message, is_reply, emoji_limit)
+        if verdict is None:
+            verdict = self._classifier.classify(message, is_reply, emoji_limit)
+            self._entries.set(key, (verdict, banned))
+        return verdict
+
+    async def classify_with(self, executor, message, is_reply=False, emoji_limit=EMOJI_LIMIT):
+        """Like classify(), with misses computed by a ClassificationExecutor."""
+        message = normalize(message)
+        key, banned, verdict = self._lookup(message, is_reply, emoji_limit)
+        if verdict is None:
+            version = self._version
+            verdict = await executor.classify(message, is_reply, emoji_limit)
+            # The rules may have been reloaded while it waited; a timed-out verdict is retried on the next copy
+            if get_registry().version == version and not verdict.timed_out:
+                self._entries.set(key, (verdict, banned))
+        return verdict
+
+    def __len__(self):
+        return len(self._entries)
+
+
+DEFAULT_STAGES = [
+    Stage("length", GATE, 0, lambda verdict: len(verdict.message), lambda length: length >= MAX_MESSAGE_LENGTH),
+    Stage("is_reply", GATE, 0, lambda verdict: verdict.is_reply, lambda is_reply: is_reply),
+    Stage("checkmarks", SIGNAL, 1, lambda verdict: verdict.message.checkmark_run,
+          lambda run: run >= CHECKMARK_RUN),
+    # Copies of recently banned texts go before the phrase lists
+    Stage("near_duplicate", SIGNAL, 2, lambda verdict: verdict.find_duplicate(),
+          lambda duplicate: duplicate is not None),
+    Stage("mixed_words", SIGNAL, 3, lambda verdict: verdict.registry.has_mixed_words(verdict.message, MIN_MIXED_WORDS),
+          lambda words: len(words) >= MIN_MIXED_WORDS),
+    # Digits and symbols in place of letters, which the mixed-words stage does not see
+    Stage("confusables", SIGNAL, 3,
+          lambda verdict: verdict.registry.has_confusable_words(verdict.message, MIN_MIXED_WORDS),
+          lambda words: len(words) >= MIN_MIXED_WORDS),
+    Stage("critical", SIGNAL, 4, lambda verdict: verdict.registry.has_critical_patterns(verdict.message),
+          lambda match: match is not None),
+    Stage("spam_phrases", SIGNAL, 5, lambda verdict: verdict.registry.new_is_spam_message(verdict.message),
+          lambda match: match is not None),
+    # Counting stops as soon as the limit is exceeded
+    Stage("emoji", SIGNAL, 6,
+          lambda verdict: verdict.message.count_emoji(verdict.emoji_limit + 1) > verdict.emoji_limit, bool),
+]
+
+# Texts banned automatically or by vote, so their changed copies are caught early
+near_duplicates = NearDuplicateIndex()
+classifier = Classifier(DEFAULT_STAGES, near_duplicates)
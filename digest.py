@@ -0,0 +1,141 @@
+"""Owner reports of automatic bans, collected into one summary per owner and window.
+
+An owner who turned the digest on gets no report per ban. The first ban opens a
+window of the owner's length; when it closes, one message lists the counts by
+deciding stage, by chat, the most frequent matched tokens and a few sample texts.
+Media messages keep their full report for the first MEDIA_LIMIT cases of a window.
+"""
+import asyncio
+import html
+from collections import Counter
+from outbound import REPORT
+
+MEDIA_LIMIT = 3
+SAMPLE_LIMIT = 5
+SAMPLE_LENGTH = 200
+# Rules ending in [\s\S]* match up to the end of the text
+TOKEN_LENGTH = 60
+TOP_LIMIT = 10
+# Telegram's limit is 4096 characters; the HTML tags are left out of it, the margin covers escaping
+MESSAGE_LENGTH = 4000
+
+STAGE_NAMES = {
+    "checkmarks": "галочки",
+    "near_duplicate": "копия удалённого текста",
+    "mixed_words": "смешанные слова",
+    "confusables": "цифры вместо букв",
+    "critical": "критические токены",
+    "spam_phrases": "основное регулярное выражение",
+    "emoji": "эмодзи",
+}
+
+
+def shorten(text, length):
+    return text if len(text) <= length else text[:length] + "…"
+
+
+def matched_tokens(verdict):
+    """What the deciding stage matched, without running the stages it skipped."""
+    if verdict.decided_by == "critical":
+        return [verdict.crit_match.group()]
+    if verdict.decided_by == "spam_phrases":
+        return [verdict.spam_match.group()]
+    if verdict.decided_by in ("mixed_words", "confusables"):
+        return list(verdict[verdict.decided_by])
+    return []
+
+
+class Digest:
+    """Bans of one owner's window."""
+
+    __slots__ = ("minutes", "bans", "failed", "triggers", "chats", "tokens", "samples", "media")
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.bans = 0
+        self.failed = 0
+        self.triggers = Counter()
+        self.chats = Counter()
+        self.tokens = Counter()
+        self.samples = []
+        self.media = 0
+
+    def add(self, message, verdict, errors):
+        """Count a ban. Returns True when it still gets a report of its own."""
+        self.bans += 1
+        if errors:
+            self.failed += 1
+        trigger = STAGE_NAMES.get(verdict.decided_by, verdict.decided_by)
+        category = verdict.category
+        self.triggers[f"{trigger} ({category})" if category else trigger] += 1
+        self.chats[shorten(message.chat.title or str(message.chat_id), TOKEN_LENGTH)] += 1
+        self.tokens.update(shorten(token.casefold(), TOKEN_LENGTH) for token in matched_tokens(verdict))
+        if len(self.samples) < SAMPLE_LIMIT:
+            sample = shorten(message.text or message.caption, SAMPLE_LENGTH)
+            # A raid repeats one text; distinct ones say more
+            if sample not in self.samples:
+                self.samples.append(sample)
+        if message.text is None and self.media < MEDIA_LIMIT:
+            self.media += 1
+            return True
+        return False
+
+    def render(self):
+        """The digest as HTML messages, split between lines so each one fits in a Telegram message."""
+        def counts(counter):
+            return [f"• {html.escape(name)}: {count}" for name, count in counter.most_common(TOP_LIMIT)]
+
+        lines = [f"📋 <b>Сводка за {self.minutes} мин.:</b> автоматически удалено сообщений: {self.bans}"]
+        if self.failed:
+            lines.append(f"Не удалось удалить или забанить: {self.failed}")
+        lines += ["", "<b>По признакам:</b>", *counts(self.triggers), "", "<b>По чатам:</b>", *counts(self.chats)]
+        if self.tokens:
+            lines += ["", "<b>Частые совпадения:</b>", *counts(self.tokens)]
+        lines += ["", "<b>Примеры:</b>"]
+        lines += [f"{number}. {html.escape(sample)}" for number, sample in enumerate(self.samples, 1)]
+
+        messages = [lines[0]]
+        for line in lines[1:]:
+            if len(messages[-1]) + 1 + len(line) > MESSAGE_LENGTH:
+                if line:
+                    messages.append(line)
+            else:
+                messages[-1] += "\n" + line
+        return messages
+
+
+class DigestCollector:
+    """Open digests by owner. A closed digest is sent through the notification queue."""
+
+    def __init__(self, notifications):
+        self._notifications = notifications
+        self._digests = {}
+        self._timers = {}
+
+    def add(self, bot, owner_id, minutes, message, verdict, errors):
+        """Count a ban in the owner's digest. Returns True when it still gets a report of its own."""
+        digest = self._digests.get(owner_id)
+        if digest is None:
+            digest = self._digests[owner_id] = Digest(minutes)
+            self._timers[owner_id] = asyncio.get_running_loop().call_later(
+                minutes * 60, self._close, bot, owner_id)
+        return digest.add(message, verdict, errors)
+
+    def _close(self, bot, owner_id):
+        del self._timers[owner_id]
+        digest = self._digests.pop(owner_id)
+        self._notifications.submit(owner_id, lambda: self._send(bot, owner_id, digest))
+
+    async def _send(self, bot, owner_id, digest):
+        for text in digest.render():
+            await bot.send_message(chat_id=owner_id, text=text, parse_mode="HTML", disable_web_page_preview=True,
+                                   rate_limit_args=REPORT)
+
+    def __len__(self):
+        return len(self._digests)
+
+    def flush(self, bot):
+        """Close every open window now, queueing its digest. Called on shutdown."""
+        for owner_id, timer in list(self._timers.items()):
+            timer.cancel()
+            self._close(bot, owner_id)
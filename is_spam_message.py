@@ -1,319 +1,417 @@
+import hashlib
+import os
 import re
+from mixed_script import find_confusable_words, find_mixed_words
+from normalization import fold_case, normalize, trie_pattern
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Rule files, one list each. A file holds one regex per line; "@name" lines set the
+# category of the rules below them, and blank lines and "#" comments are skipped.
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+RULE_FILES = {
+    "crit_phrases": "critical.txt",
+    "main_phrases": "main.txt",
+    "supporting_phrases": "supporting.txt",
+}
+
+# Reference definition of a mixed word; mixed_script.find_mixed_words implements it
+MIXED_WORDS_PATTERN = r"\b(?=[^\s_-]*[а-яА-ЯёЁ]+)[^\s_-]*[^-\sа-яА-ЯёЁ\W\d_]+[^\s_-]*\b"
+
+# Rules whose longest required literal is shorter than this always go to the regex engine
+MIN_ANCHOR_LENGTH = 3
+
+# One "(?=.*\bстем\w*)" or "(?=.*\bслово\b)" term of a co-occurrence rule
+_COOCCURRENCE_TERM = re.compile(r"\(\?=\.\*\\b((?:\w|\[\w+\])+)(\\w\*|\\b)\)")
+_STEM_PART = re.compile(r"\[(\w+)\]|(\w)")
+
+_SPACE_CLASS = [(sre_constants.CATEGORY, sre_constants.CATEGORY_SPACE)]
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+
+def _rule_source(phrase):
+    # Every rule is matched case-insensitively, and since Python 3.11 an inline "(?i)"
+    # that ends up in the middle of a joined expression is a hard error.
+    if phrase.startswith("(?i)"):
+        return phrase[4:]
+    return phrase
+
+
+def _compile_rule(phrase):
+    return re.compile(_rule_source(phrase), re.IGNORECASE | re.DOTALL)
+
+
+def _is_whitespace(op, av):
+    if op is sre_constants.IN:
+        return av == _SPACE_CLASS
+    return op in _REPEATS and av[0] >= 1 and len(av[2]) == 1 and _is_whitespace(*av[2][0])
+
+
+def _anchor_candidates(items):
+    # Each candidate is a set of casefolded strings one of which occurs in every match
+    candidates = []
+    run = []
+
+    def flush():
+        literal = "".join(run).strip()
+        if literal:
+            candidates.append(frozenset([literal]))
+        run.clear()
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            char = fold_case(chr(av))
+            if char.isspace():
+                char = " "
+            if char != " " or (run and run[-1] != " "):
+                run.append(char)
+        elif op is sre_constants.AT:
+            continue
+        elif _is_whitespace(op, av):
+            if run and run[-1] != " ":
+                run.append(" ")
+        else:
+            flush()
+            if op is sre_constants.SUBPATTERN:
+                candidates.extend(_anchor_candidates(av[-1]))
+            elif op in _REPEATS and av[0] >= 1:
+                candidates.extend(_anchor_candidates(av[2]))
+            elif op is sre_constants.BRANCH:
+                branches = [_best_anchors(branch) for branch in av[1]]
+                if all(branches):
+                    candidates.append(frozenset().union(*branches))
+    flush()
+    return candidates
+
+
+def _best_anchors(items):
+    candidates = [anchors for anchors in _anchor_candidates(items)
+                  if min(map(len, anchors)) >= MIN_ANCHOR_LENGTH]
+    return max(candidates, key=lambda anchors: (min(map(len, anchors)), -len(anchors)), default=None)
+
+
+def required_literals(phrase):
+    """Casefolded literals at least one of which occurs in any text the phrase matches.
+
+    Whitespace runs are collapsed to a single space on both sides. Returns None when
+    the phrase has no literal of at least MIN_ANCHOR_LENGTH characters.
+    """
+    if phrase.startswith("(?i)"):
+        phrase = phrase[4:]
+    return _best_anchors(sre_parse.parse(phrase, re.IGNORECASE))
+
+
+class LiteralPrefilter:
+    """Finds every rule anchor in a casefolded, whitespace-collapsed text in one pass.
+
+    The anchors are compiled into a single trie-shaped expression, so the regex engine
+    walks the text once as a multi-pattern automaton instead of trying hundreds of
+    alternatives at every position.
+    """
+
+    def __init__(self, anchors):
+        anchors = set(anchors)
+        self._pattern = trie_pattern(anchors) if anchors else None
+        # The engine reports the longest anchor starting at a position; shorter anchors
+        # starting there are its prefixes.
+        self._prefixes = {
+            anchor: tuple(other for other in anchors if anchor.startswith(other))
+            for anchor in anchors
+        }
+
+    def scan(self, normalized):
+        found = set()
+        if self._pattern is None:
+            return found
+        search = self._pattern.search
+        match = search(normalized)
+        while match:
+            found.update(self._prefixes[match.group()])
+            match = search(normalized, match.start() + 1)
+        return found
+
+
+def _expand_stem(stem):
+    variants = [""]
+    for char_class, char in _STEM_PART.findall(stem):
+        variants = [variant + option for variant in variants for option in (char_class or char)]
+    return frozenset(fold_case(variant) for variant in variants)
+
+
+def parse_cooccurrence_rule(phrase):
+    """Split a "(?=.*\\bA\\w*)(?=.*\\bB\\b).*" rule into (stems, is_whole_word) terms.
+
+    Returns None for any phrase that is not a pure co-occurrence rule.
+    """
+    body = phrase[:-2] if phrase.endswith(".*") else phrase
+    terms = []
+    pos = 0
+    while pos < len(body):
+        term = _COOCCURRENCE_TERM.match(body, pos)
+        if term is None:
+            return None
+        terms.append((_expand_stem(term.group(1)), term.group(2) == r"\b"))
+        pos = term.end()
+    return tuple(terms) if len(terms) > 1 else None
+
+
+class CooccurrenceMatch:
+    """Truthy stand-in for re.Match returned when a co-occurrence rule fires."""
+
+    __slots__ = ("phrase", "tokens")
+
+    def __init__(self, phrase, tokens):
+        self.phrase = phrase
+        self.tokens = tokens
+
+    def group(self):
+        return " + ".join(self.tokens)
+
+
+class RuleMatch:
+    """Picklable copy of an re.Match: the pattern of the rule and the text it matched."""
+
+    __slots__ = ("phrase", "text")
+
+    def __init__(self, phrase, text):
+        self.phrase = phrase
+        self.text = text
+
+    def group(self):
+        return self.text
+
+
+def detach_match(match):
+    """A match that can be sent to another process, or None."""
+    if match is None or isinstance(match, (CooccurrenceMatch, RuleMatch)):
+        return match
+    return RuleMatch(match.re.pattern, match.group())
+
+
+class CooccurrenceRules:
+    """Rules of the form "word A and word B anywhere in the text", over one tokenization.
+
+    The regex form rescans the rest of the text from every start position, which is
+    quadratic on long texts. Here every distinct casefolded token is checked once against
+    the stem tables, and a rule fires when all of its term bits are set.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = tuple(phrases)
+        term_bits = {}
+        self._rules = []
+        for phrase in self.phrases:
+            mask = 0
+            for term in parse_cooccurrence_rule(phrase):
+                mask |= term_bits.setdefault(term, 1 << len(term_bits))
+            self._rules.append((phrase, mask))
+        self._whole_words = {}
+        self._prefixes = {}
+        for (stems, is_whole_word), bit in term_bits.items():
+            for stem in stems:
+                if is_whole_word:
+                    self._whole_words[stem] = self._whole_words.get(stem, 0) | bit
+                else:
+                    table = self._prefixes.setdefault(len(stem), {})
+                    table[stem] = table.get(stem, 0) | bit
+        self._prefixes = sorted(self._prefixes.items())
+
+    def search(self, tokens):
+        """Return a CooccurrenceMatch for the first rule whose terms all occur in tokens."""
+        if not self._rules:
+            return None
+        seen = 0
+        first_token = {}
+        for token in tokens:
+            found = self._whole_words.get(token, 0)
+            for length, table in self._prefixes:
+                if length > len(token):
+                    break
+                found |= table.get(token[:length], 0)
+            new_bits = found & ~seen
+            if new_bits:
+                seen |= new_bits
+                while new_bits:
+                    bit = new_bits & -new_bits
+                    first_token[bit] = token
+                    new_bits ^= bit
+        for phrase, mask in self._rules:
+            if seen & mask == mask:
+                tokens = []
+                while mask:
+                    bit = mask & -mask
+                    tokens.append(first_token[bit])
+                    mask ^= bit
+                return CooccurrenceMatch(phrase, tokens)
+        return None
+
+
+class RuleSet:
+    """One phrase list. Regex rules only run when the prefilter saw one of their anchors."""
+
+    __slots__ = ("anchors", "_unanchored", "_by_anchor", "cooccurrence")
+
+    def __init__(self, phrases):
+        self._unanchored = []
+        self._by_anchor = {}
+        cooccurrence_phrases = []
+        for index, phrase in enumerate(phrases):
+            if parse_cooccurrence_rule(phrase):
+                cooccurrence_phrases.append(phrase)
+                continue
+            rule = (index, _compile_rule(phrase))
+            anchors = required_literals(phrase)
+            if anchors is None:
+                self._unanchored.append(rule)
+            else:
+                for anchor in anchors:
+                    self._by_anchor.setdefault(anchor, []).append(rule)
+        self.anchors = frozenset(self._by_anchor)
+        self.cooccurrence = CooccurrenceRules(cooccurrence_phrases)
+
+    def search(self, message, anchors):
+        candidates = set(self._unanchored)
+        for anchor in anchors:
+            candidates.update(self._by_anchor.get(anchor, ()))
+        # Leftmost match wins and ties go to the earlier rule, same as one big alternation
+        best = None
+        for _, pattern in sorted(candidates, key=lambda rule: rule[0]):
+            match = pattern.search(message.text)
+            if match and (best is None or match.start() < best.start()):
+                best = match
+                if best.start() == 0:
+                    break
+        if best:
+            return best
+        return self.cooccurrence.search(message.words)
+
+
+class PatternRegistry:
+    """Rule sets compiled once. Never mutated: to change the rules, build a new registry."""
+
+    __slots__ = ("version", "crit_phrases", "main_phrases", "supporting_phrases", "categories",
+                 "crit_rules", "main_rules", "supporting_rules", "prefilter")
+
+    def __init__(self, crit_phrases, main_phrases, supporting_phrases, categories=None):
+        fields = {
+            "crit_phrases": tuple(crit_phrases),
+            "main_phrases": tuple(main_phrases),
+            "supporting_phrases": tuple(supporting_phrases),
+            # Keyed by the pattern the rule compiles to, which is what a match carries
+            "categories": {_rule_source(phrase): category for phrase, category in (categories or {}).items()},
+        }
+        digest = hashlib.sha1()
+        for name in ("crit_phrases", "main_phrases", "supporting_phrases"):
+            digest.update("\x00".join(fields[name]).encode("utf-8") + b"\x01")
+        # A category change alters the reports, so it is a new version too
+        for phrase, category in sorted(fields["categories"].items()):
+            digest.update(f"{phrase}\x00{category}\x01".encode("utf-8"))
+        fields["version"] = digest.hexdigest()[:12]
+        fields["crit_rules"] = RuleSet(fields["crit_phrases"])
+        fields["main_rules"] = RuleSet(fields["main_phrases"])
+        fields["supporting_rules"] = RuleSet(fields["supporting_phrases"])
+        fields["prefilter"] = LiteralPrefilter(
+            fields["crit_rules"].anchors | fields["main_rules"].anchors | fields["supporting_rules"].anchors
+        )
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PatternRegistry is immutable")
+
+    def has_critical_patterns(self, message):
+        message = normalize(message)
+        return self.crit_rules.search(message, message.anchors(self.prefilter))
+
+    def new_is_spam_message(self, message):
+        """The match of the main list when a supporting phrase occurs too, otherwise None."""
+        message = normalize(message)
+        anchors = message.anchors(self.prefilter)
+        match = self.main_rules.search(message, anchors)
+        if not match or not self.supporting_rules.search(message, anchors):
+            return None
+        return match
+
+    def has_mixed_words(self, message, limit=None):
+        return find_mixed_words(normalize(message).text, limit)
+
+    def has_confusable_words(self, message, limit=None):
+        return find_confusable_words(normalize(message).text, limit)
+
+    def category(self, match):
+        """Category of the rule behind a match of this registry, or None."""
+        if match is None:
+            return None
+        phrase = match.phrase if isinstance(match, (CooccurrenceMatch, RuleMatch)) else match.re.pattern
+        return self.categories.get(phrase)
+
+
+def parse_rules(lines, source="<rules>"):
+    """Phrases of a rule file in order, and the category of each phrase that has one.
+
+    A rule that does not compile raises ValueError naming its line.
+    """
+    phrases = []
+    categories = {}
+    category = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("@"):
+            category = line[1:].strip() or None
+            continue
+        try:
+            _compile_rule(line)
+        except re.error as e:
+            raise ValueError(f"{source}:{number}: {e}") from e
+        phrases.append(line)
+        if category is not None:
+            categories.setdefault(line, category)
+    return phrases, categories
+
+
+def load_registry(directory=RULES_DIR):
+    """A registry compiled from the rule files. Takes a while: keep it off the event loop."""
+    lists = {}
+    categories = {}
+    for field, name in RULE_FILES.items():
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8-sig") as file:
+            lists[field], file_categories = parse_rules(file, path)
+        for phrase, category in file_categories.items():
+            categories.setdefault(phrase, category)
+    return PatternRegistry(categories=categories, **lists)
+
+
+_registry = load_registry()
+
+
+def get_registry():
+    return _registry
+
+
+def set_registry(registry):
+    """Swap in a new registry. Verdicts already started keep the registry they began with."""
+    global _registry
+    _registry = registry
+
 
 def has_critical_patterns(text):
-    crit_spam_phrases = [
-		  # Whole message examples
-        r"\bесть\s+несколько\s+мест\s+на\s+удаленк[ау]\s+с\s+хорошим\s+доходом\b",
-        r"\bзанятость\s+[0-9]+(-[0-9]+)?\s+час(а|ов)?\s+в\s+день\b",
-        r"\bздравствуй,\s+друг\b",
-        r"\bтолько\s+[0-9]+(\s*\+)?\s*лет\b"
-        r"\bсредний\s+доход\s+[0-9]+\$?\s+в\s+(неделю|день|месяц)\b",
-        r"\bс\s+тебя\s+телефон\s+и\s+два\s+часа\s+свободного\s+времени\s+в\s+день\b",
-        r"\bзаработок\s+очень\s+достойный\b",
-        r"\bвзаимовыгодное\s+сотрудничество\s+от\s+[0-9]+(-[0-9]+)?\$?\s+в\s+день\b",
-        r"\bхотите\s+увеличить\s+свой\s+доход,\s+затрачивая\s+минимум\s+времени\s+и\s+работая\s+удаленно\?\b",
-        r"\bприсоединяйтесь\s+к\s+нашей\s+команде\b",
-        r"\bмы\s+ищем\s+совершеннолетних\s+целеустремленных\s+людей\b",
-        r"[‼️]+\s*срочно\s*[‼️]+\b",
-        r"\bэто\s+касается\s+каждого\s+в\s+этой\s+группе\b",
-        r"\bпроходит\s+обучение\s+для\s+новичков\b",
-        r"\bбез\s+наркотиков,\s+инвестиций\s+и\s+прочей\s+ерунды\b",
-        r"\bприбыль\s+вы\s+получите\s+уже\s+в\s+первый\s+день\s+работы\b",
-        r"\bвсего\s+[0-9]+\s+час(а|ов)?\s+твоего\s+времени\s+в\s+день\b",
-        r"\bдовед[её]м\s+вас\s+за\s+ручку",
-        r"\bработаем\s+[зн]а\s+%\b",
-        r"\bудал[её]нн(?:ый|ую|ая|ое)\s+(формат|работ[ау]|деятельность)\b",
-        r"\bналичие\s+телефона\s+и\s+\d+\s+час(?:а|ов)?\s+свободного\s+времени\b",
-        r"\bищу\s+людей\s+с\s+биржами\b",
-        r"\bНУЖНЫ\s+ОТВЕТСТВЕННЫЕ\s+ЛЮДИ\b",
-        r"\bл[её]гких\s+денег\s+не\s+бывает\b",
-        r"\bс\s+хорошей\s+дополнительной\s+прибылью\b",
-        r"\bдвух\s+человек\s+на\s+обучение\b",
-        r"\bПоследние\s+места\s+в\s+команду\s+по\s+удалённому\s+заработку\b",
-        r"\bочень\s+все\s+просто\s+и\s+прозрачно\b",
-        
-		  # Contact
-		  r"(?=.*\bзаинтересова\w*)(?=.*\bпиши\w*).*",
-        r'(?:ставь(?:те)?|пиши(?:те)?|напиши(?:те)?|писать)(?:\s+(?:мне|в\s*лс))?\s*[«""]?\+[»""]?',
-        r"\bпиши\s+плюс\b",
-        
-		  # Earnings
-        r"\bпервые\s+хорошие\s+деньги\b",
-        r"\bв\s+рентабельном\s+направлении\b",
-        r"\bдля\s+рентабельного\s+проекта\b",
-        # "До 1200$ в неделю","от 400 баксов в неделю","От 1000$ в неделю","от 900 долларов в неделю","от $700 в неделю", "Доход от 300 длр в день", "от +300$ в день", "до 1200 баксов в день"
-        r"(?i)(?:от|до)\s*(?:\$?\s*\d+(?:[.,]\d+)?|\d+(?:[.,]\d+)?\s*(?:баксов|долларов|длр|USD|\$))(?:\s*[.,])?\s+в\s+(?:неделю|день)",
-        r"(?i)\d+\/неделю[\s\S]*",
-        
-		  r"\bсистема\s+потоковых\s+продаж\b",
-        r"\smart\s+money\b",
-        r"\bматериал\s+по\s+инвестированию\b",
-        r"\bтехнический\s+анализ\b",
-        r"\bкурсы\s+по\s+крипте\b",
-        
-		  # Gambling
-        r"ton_games",
-        r"ton_bot",
-        r"телеграм\s+бот\s+казино",
-        r"казино\s+бот",
-        r"казинобот",
-        r"казино-бот\w*",
-        r"фриспин\w*",
-        r"криптоказино",
-        r"\w*казино\s+JetTon\b",
-        r"\w*казино\s+TONCOIN\b",
-        r"\bпроект\s+TONCOIN\b",
-        r"Sugar\s+Rush",
-        r"бонуск[у|и|а]",
-        r"(?=.*\bвыигр\w*)(?=.*\bказино\b).*",
-        r"(?=.*\bказино\b)(?=.*\bTONCOIN\b).*",
-        r"(?=.*\bпополнил\w*)(?=.*\bслот\w*).*",
-        r"(?=.*\bрубл\w*)(?=.*\bслот\w*).*",
-        r"(?=.*\bвыигр\w*)(?=.*\bслот\b).*",
-        r"\bигра[юл]\s+тут\b",
-        r"\bказик\w*",
-        r"\bCRYPTO\s+CASINO\b",
-        r"\bSweet\s+Bonanza\b",
-        
-		  # Adult
-        r"\bфото[,\.]?\s+видео\s+девушек\b",
-        r"\bпереписки\s+и\s+сохраненные\s+фото\b",
-        r"\bмоментальная\s+проверка\s+соц\.\s+сети\s+девушки\b",
-        r"\bсобраны\s+все\s+сливы\b",
-        r"\bдевушек\s+твоего\s+города\b",        
-        r"\bфото\s+и\s+видео\s+любой\s+девушки\b", 
-        
-		  r"(?=.*\bпровер\w*)(?=.*\bподруг\w*).*",
-        r"(?=.*\bпровер\w*)(?=.*\bдевушк\w*).*",
-        r"(?=.*\bпровер\w*)(?=.*\bжен\w*).*",
-        
-        r"(?=.*\bинтим\w*)(?=.*\b18\w*).*",
-        r"(?=.*\bинтим\w*)(?=.*\bконтент\w*).*",
-        r"(?=.*\bинтим\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bслиты\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bслиты\w*)(?=.*\bвидео\w*).*",
-        r"(?=.*\bслив\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bслив\w*)(?=.*\bвидео\w*).*",
-        r"(?=.*\bобнаж[её]н\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bобнаж[её]н\w*)(?=.*\bвидео\w*).*",
-        r"(?=.*\bпикантн\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bпикантн\w*)(?=.*\bвидео\w*).*",
-        r"(?=.*\bгол\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bгол\w*)(?=.*\bвидео\w*).*",
-        r"(?=.*\bоткровен\w*)(?=.*\bфото\w*).*",
-        r"(?=.*\bоткровен\w*)(?=.*\bвидео\w*).*",
-	 ]
-    crit_pattern = re.compile("|".join(crit_spam_phrases), re.IGNORECASE | re.DOTALL)
-    has_crit = crit_pattern.search(text)
-    return has_crit
+    return _registry.has_critical_patterns(text)
+
 
 def new_is_spam_message(text):
-    # Main spam phrases
-    main_spam_phrases = [
-        # Recruitment patterns
-        r"\bнужн[аы]?\s+(люди|сотрудники)\b",
-        r"\bсотрудник(?:и|ов)?\s+для\s+удал[её]нной\s+работы\b",
-        r"\bид[её]т\s+набор\s+людей\b",
-        r"\bнабор\s+для\s+сотрудничества\b",
-        r"\bлюдей\s+для\s+сотрудничества\b",
-        r"\bна\s+удал[её]нную\s+деятельность\b",
-        r"\bместа\s+ограничены\b",
-        r"\bмест\s+мало\b",
-        r"\bвзаимовыгодн(?:ое|ая|ые)\s+сотрудничество\b",
-        r"\bнужны\s+люди\s+для\s+сотрудничества\b",
-        r"\bищ(?:у|ем)+\s+ответственн\w*",
-        r"\bдля\s+удалённого\s+сотрудничества\b",
-        r"\bудалённого\s+заработка\b",
-        r"\bзаинтересованных\s+людей\b",
-        r"\bтребуются\s+люди\b",
-        r"\bищ(?:у|ем)+\s+людей\b",
-        r"\bнужн[аы]?\s+(люди|сотрудники)\b",
-        r"\bищ(?:у|ем)+\s+партн[её]ров\b",
-        r"\bнабира(?:ю|ем)+\s+партн[её]ров\b",
-        r"\bамбициозного\s+человека\b",
-        r"\bамбициозных\s+людей\b",
-        r"\bлюдей\s+в\s+команду\b",
-        r"\bчастичная\s+занятость\b",
-        r"\bинтересная\s+занятость\b",
-        r"\bкоманду\s+для\s+сотрудничества\b",
-        r"\bновый\s+проект\b",
-        r"\bрасширяем\s+команду\s+для\b",
-        r"в\s+поиске*.+партнеров",
-
-		  # Remote
-		  r"онлайн\s+через\s+телефон",
-		  r"(?=.*\bудалён\w*)(?=.*\bсотруднич\w*)",
-        r"\bиз\s+любой\s+точки\s+мира\b",
-        
-        # Earnings patterns
-        r"\bпассивный\s+источник\s+дохода\b",
-        r"\bновое\s+направление\b",
-        r"\bот\s+\d+(-\d+)?\s*(\$|долларов?)\s+(в\s+день|в\s+месяц)?\b",
-        r"\bзарабатывать\s+каждый\s+день\s+от\s+\d+\s*(\$|долларов?)\b",
-        r"\bзарабатывать\s+пассивно\b",
-        r"\bежедневн(?:ый|о)\s+доход\b",
-        r"\bдоход\s+в\s+неделю\b",
-        r"\bвысокий\s+доход\b",
-        r"\bдостойный\s+заработок\b",
-        r"\bпассивный\s+заработок\b",
-        r"\bпасивного\s+заработка\b",
-        r"\bпассивного\s+дохода\b",
-        r"\bпассивный\s+доход\b",
-        r"\bна\s+пассиве\b",
-        r"\bлегальная\s+доходность\b",
-        r"\bЕсть\s+ТЕМКА\b",
-        r"\bЕсть\s+Тема\b",
-        r"\bлегальная\s+доходность\b",
-        r"\bполучать\s+доход\b",
-        r"\bпассивная\s+прибыль\b",
-        r"\bпассивного\s+заработка\b",
-        r"\bпассивного\s+дохода\b",
-        r"\bпомогу\s+заработать\b",
-        r"\bеженедельный\s+доход\b",
-        r"\bдоход\s+онлайн\b",
-        r"\bработ[ау]\s+на\s+удал[её]нке\b",
-        r"\bудал[её]нная\s+занятость\b",
-        r"\bудобный\s+график\b",
-        r"\bработ[ау]\s+с\s+телефона\b",
-        r"\bвс[её]\s+с\s+телефона\b",
-        r"\bнужен только телефон\b",
-        r"\bнужен\s+человек\s+на\b",
-        r"\bна\s+удалённую\b",
-        r"\bдля\s+взаимовыгодного\s+сотрудничества\b",
-        r"\bудал[её]нный\s+заработок\b",
-        r"\bзаработок\s+удал[её]нно\b",
-        r"\bзаработок\s+от\b",
-        r"\bдля\s+хорошего\s+дохода\b",
-        r"\bвсе\s+легально\b",
-        r"\bдля\s+работы\s+нужен\s+смартфон\b",
-        r"\bДоход\s+каждый\s+день\b",
-        r"\bдоходность\b",
-        r"\bдоход\s+от\b",
-        r"\bзарабатывать\s+от\b",
-        r"\bстабильный\s+доход\b",
-        r"\bдополнительный\s+доход\b",
-        r"\bвысокая\s+оплата\b",
-        r"\bоплата\s+от\b",
-        r"\bзарабатывать\s+в\s+интернете\b",
-        r"\bспособ\s+заработать\b",
-        r"\bдолларов\s+в\s+неделю\b",
-        r"\bСХЕМА\s+ЗАРАБОТКА\b",
-        r"\bНОВЫЙ\s+СПОСОБ ЗАРАБОТКа\b",
-        r"\bприбыль\s+каждый\s+день\b",
-        r"\bзарабатывать\s+из\s+любой\s+точки\s+мира\b",
-        r"\bфинансовой\s+независимости\b",
-        r"\bспособ\s+заработка\b",
-        r"\bприбыль\s+от\b",
-        
-        r"(?=.*\bприбыль\b)(?=.*\bежедневн\w*)",
-        r"(?=.*\bприбыль\b)(?=.*\bеженедель\w*)",
-        r"(?i)(?:от|до)\s+(?:ста|тысячи)\s+баксов",
-        r"(?i)пассивн(?:ым\s+онлайн\s+доходом|ый\s+прибыл)|на\s+пассиве",
-        r"(?=.*\bдоход\w*)(?=.*\bонлайн\b)",
-        r"(?=.*\bонлайн\b)(?=.*\bзанятость\b)",
-        r"(?=.*\bдоход\w*)(?=.*\bприбыл\w*)",
-
-        # Training and support patterns
-        r"\bбесплатное\s+обучение\b",
-        r"\bподдержк[ау]\s+на\s+всех\s+этапах\b",
-
-        # Urgency patterns
-        r"\bместа\s+ограничены\b",
-        r"\bмест\s+мало\b",
-        r"срочно\s+треб[уею]тся",
-
-        # Adult content patterns
-        r"\bсливы\b",
-        r"\bслив\b",
-        
-		  # Gambling and crypto
-        r"\bбукмекер\b",
-	     r"\bвыигрыш\b",
-        r"\bзарабатывать\s+на\s+криптовалюте\b",
-        r"\bа[ий]рдроп\w*", 
-        r"\bтестнет\w*", 
-        r"\bлаунчпад\w*",
-        r"\bв\s+криптовалютной\s+сфере\b",
-        r"\bстейкинг\w*",
-    ]
-
-    supporting_phrases = [
-        # Age restrictions
-        r"\bс\s+\d+\s+лет\b",
-        r"\bот\s+\d+\s+лет\b",
-        r"\b\d+\+\b",
-
-        # Contact invitation patterns
-        r"в\s+л[и|у]ч[н|к][и|е]",
-        r"л\.?\s*с",
-        r"за\s+деталями\s+в\s+лс",
-        r"за\s+деталями\s+пиш[ие]",
-        r"для\s+анкетирования",
-        r"пишите\s+мне",
-        r"пиши\s+мне",
-        r"в\s+личны[ех]\s+сообщениях",
-        r"для\s+подробностей\s+пиш[ие]",
-        r"пишите\s+в\s+лс\s+за\s+деталями",
-        r"\bпишите\s+в\s+лс\s+за\s+деталями\b",
-        r"\bпиши(\s*\+)?\s*(и\s+я\s+отправлю\s+всю\s+информацию)?\b",
-        r"\bпишите\s+в\s+лс\s*\+\b",
-        r"\bпишите\s+личку\b",
-        r"пишите\s+в\s+личку",
-        r"\bпишите\s+\+\s+в\s+личные\b",
-        r"пишите\s+в\s+лс",
-        r"\bнапишите\s+в\s+личку\b",
-        r"\bпиш[ие]те?\s+в\s+личные\s+сообщения\b",
-        r"\bза\s+деталями\s+пишите\b",
-        r"\bжду\s+в\s+личных?\s+(сообщениях|смс)\b",
-        r"\bв\s+личные\s+сообщения\b",
-        r"\bпиши\s+в\s+личные\b",
-        r"\bза\s+подробностями\b",
-        r"\bличны[ех]\s+смс\b",
-        r"\bличный\s+чат\b",
-        r"\bв\s+личном\s+чате\b",
-        r"\bдетали\s+в\s+личных\b",
-        r"\bзаинтересованных\s+жду\b",
-        r"\bза\s+подробностями\s+в\s+личные\s+сообщения\b",
-        r"\bСвяжитесь\s+со\s+мной\b",
-        r"\bбудем\s+рады\s+связаться\b",
-        r"\bжду\s+тебя\b",
-        r"\bжду\s+вас\b",
-        r"\bЗаинтересовало\?\s+Напиши\!\b",
-        r"\bобращайтесь\s+в\s+лс\b",
-        
-        r"\bЕсли\s+интересно\s+пиши\s+мне\!\b",
-        r"\bЗа\s+информацией\s+в\s+лс\b",
-        r"\bВ\s+ЛС\s+за\s+подробности\w*",
-        r"\bузнать\s+больше\?\s+Пиши\!\b",
-        
-		  r"(?=.*\bжду\b)(?=.*\bсообщен\w*)",
-        
-        # Time commitment patterns
-        r"\b\d+(-\d+)?\s*час(?:а|ов)?\s+в\s+день\b",
-        r"\b\d+(-\d+)?\s*час(?:а|ов)?\s+работы\b",
-        r"\bдо\s+\d+\s*час(?:а|ов)?\s+в\s+день\b",
-        r"\bпару\s+часов\s+в\s+день\b",
-        r"\bдвух\s+часов\s+в\s+день\b",
-
-        # Age restriction patterns
-        r"[\+\-]?\s*\d+\s*(долларов|день|usd|\$)",
-        r"(?:от|с)\s*\d+\s*(?:лет|год(?:а|ов)?)",
-        r"\b\d+\+",
-        r"\bстрого\s+[0-9]+(\s*\+)?\b",
-        r"\bсовершеннолетн(?:им|ие|ий|их)\b",
-        
-		  # To catch adult leak bots
-		  r"\bдевуш(?:ек|ки)\b",
-        r"\bличные\s+переписки\b"
-    ]
-
-    # Compile patterns
-    main_pattern = re.compile("|".join(main_spam_phrases), re.IGNORECASE | re.DOTALL)
-    supporting_pattern = re.compile("|".join(supporting_phrases), re.IGNORECASE | re.DOTALL)
-
-    return main_pattern.search(text) and supporting_pattern.search(text)
+    return _registry.new_is_spam_message(text)
+
 
 def has_mixed_words(text):
-    regex = r"\b(?=[^\s_-]*[а-яА-ЯёЁ]+)[^\s_-]*[^-\sа-яА-ЯёЁ\W\d_]+[^\s_-]*\b"
-    matches = re.findall(regex, text)
-    return matches
\ No newline at end of file
+    return _registry.has_mixed_words(text)
+
+
+def has_confusable_words(text):
+    return _registry.has_confusable_words(text)
@@ -0,0 +1,181 @@
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedCounter:
+    """Counts events and logs the running total at most once per interval."""
+
+    def __init__(self, name, interval=300.0):
+        self.name = name
+        self.interval = interval
+        self.value = 0
+        self._reported_value = 0
+        self._reported_at = time.monotonic()
+
+    def increment(self, amount=1):
+        self.value += amount
+        now = time.monotonic()
+        if now - self._reported_at >= self.interval:
+            logger.warning("%s: %d total, %d in the last %.0f s",
+                           self.name, self.value, self.value - self._reported_value, now - self._reported_at)
+            self._reported_value = self.value
+            self._reported_at = now
+
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *values, amount=1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name, self.labels, values, value
+
+
+class Histogram:
+    """Observations per combination of label values, counted into fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+
+    def observe(self, value, *values):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *values)
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield self.name + "_bucket", names, values + (_format_value(bound),), cumulative
+            yield self.name + "_sum", self.labels, values, series[-1]
+            yield self.name + "_count", self.labels, values, cumulative
+
+
+class CallbackMetric:
+    """A value read at collection time from something that already keeps it."""
+
+    def __init__(self, name, help, function, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self._function = function
+
+    def samples(self):
+        yield self.name, (), (), self._function()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, function, kind="gauge"):
+        return self._add(CallbackMetric(name, help, function, kind))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, values, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry over plain HTTP, for Prometheus to scrape from localhost."""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            method, path = (request.split(b" ", 2) + [b"", b""])[:2]
+            if method == b"GET" and path.split(b"?")[0] in (b"/", b"/metrics"):
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,135 @@
+"""Words that mix Cyrillic with other letters, such as "Зaрaбoтoк" with Latin "a" and "o".
+
+A word is mixed exactly when MIXED_WORDS_PATTERN would find it:
+
+    \\b(?=[^\\s_-]*[а-яА-ЯёЁ]+)[^\\s_-]*[^-\\sа-яА-ЯёЁ\\W\\d_]+[^\\s_-]*\\b
+
+Words are the runs between whitespace, "_" and "-". Instead of trying that pattern
+at every position, one scan looks for the spot where a Cyrillic letter and another
+letter meet inside a run, with only digits or punctuation in between. Text without
+such a spot, which is almost every message, is rejected at the speed of the scan;
+only runs that contain one are examined further.
+
+Digits and symbols in place of Cyrillic letters ("д0ход", "з4работок") are not letters,
+so the pattern cannot see them; find_confusable_words finds those words separately.
+"""
+import re
+
+# Characters put in place of Cyrillic letters: 0 for "о", 3 for "з" or "е", 4 for "а" or "ч",
+# 6 for "б", @ for "а"
+CONFUSABLES = "0346@"
+
+_CYRILLIC = "а-яА-ЯёЁ"
+# Any word character that is not Cyrillic, a digit or "_"
+_LETTER = rf"[^\W\d_{_CYRILLIC}]"
+# Run characters that are neither: digits and punctuation
+_NEUTRAL = r"(?:\d|[^\w\s-])"
+
+# A non-Cyrillic letter followed by a Cyrillic one in the same run. Searched on the text
+# and on its reverse, so that only the rarer non-Cyrillic letters start a match attempt.
+# The repeat cannot take the letter that ends the match, so the scan stays linear.
+_CROSSING = re.compile(rf"{_LETTER}{_NEUTRAL}*[{_CYRILLIC}]")
+_CYRILLIC_CHAR = re.compile(f"[{_CYRILLIC}]")
+_LETTER_CHAR = re.compile(_LETTER)
+_RUN_CHARS = re.compile(r"[^\s_-]*")
+_CONFUSABLE = re.compile(rf"[{_CYRILLIC}][{CONFUSABLES}]+[{_CYRILLIC}]")
+_WORD_CHARS = re.compile(r"[^\W_]*")
+
+
+def _is_word(text, position):
+    return 0 <= position < len(text) and (text[position].isalnum() or text[position] == "_")
+
+
+def _is_boundary(text, position):
+    return _is_word(text, position - 1) != _is_word(text, position)
+
+
+def _pattern_span(text, start, end):
+    """(start, end) of what MIXED_WORDS_PATTERN finds in the run text[start:end], or None."""
+    # The match begins at the first word boundary of the run: if the pattern fails
+    # there, it fails at every later position too.
+    begin = next((position for position in range(start, end) if _is_boundary(text, position)), None)
+    if begin is None or not _CYRILLIC_CHAR.search(text, begin, end):
+        return None
+    letter = _LETTER_CHAR.search(text, begin, end)
+    if letter is None:
+        return None
+    # ...and ends at the last word boundary after its first non-Cyrillic letter
+    for position in range(end, letter.start(), -1):
+        if _is_boundary(text, position):
+            return begin, position
+    return None
+
+
+class _Text:
+    """Run and word bounds around a position; the reversed copy is made on first need."""
+
+    def __init__(self, text):
+        self.text = text
+        self._reversed = None
+
+    @property
+    def reversed(self):
+        if self._reversed is None:
+            self._reversed = self.text[::-1]
+        return self._reversed
+
+    def _back(self, pattern, position):
+        match = pattern.match(self.reversed, len(self.text) - position)
+        return position - (match.end() - match.start())
+
+    def run(self, position):
+        return self._back(_RUN_CHARS, position), _RUN_CHARS.match(self.text, position).end()
+
+    def word(self, start, end):
+        return self._back(_WORD_CHARS, start), _WORD_CHARS.match(self.text, end).end()
+
+    def crossings(self):
+        """Start of every run with a crossing, in no particular order, each at most twice."""
+        crossing = _CROSSING.search(self.text)
+        while crossing:
+            start, end = self.run(crossing.start())
+            yield start, end
+            crossing = _CROSSING.search(self.text, end)
+        length = len(self.text)
+        crossing = _CROSSING.search(self.reversed)
+        while crossing:
+            start, end = self.run(length - crossing.start() - 1)
+            yield start, end
+            crossing = _CROSSING.search(self.reversed, length - start)
+
+
+def find_mixed_words(text, limit=None):
+    """Mixed words of text in order; stops early once limit words are found."""
+    if not _CYRILLIC_CHAR.search(text) or not _LETTER_CHAR.search(text):
+        return []
+
+    spans = []
+    seen = set()
+    for start, end in _Text(text).crossings():
+        if start in seen:
+            continue
+        seen.add(start)
+        span = _pattern_span(text, start, end)
+        if span:
+            spans.append(span)
+            if limit is not None and len(spans) >= limit:
+                break
+
+    spans.sort()
+    return [text[start:end] for start, end in spans]
+
+
+def find_confusable_words(text, limit=None):
+    """Words with a confusable between two Cyrillic letters, in order; stops early once limit words are found."""
+    if not any(character in text for character in CONFUSABLES):
+        return []
+
+    bounds = _Text(text)
+    words = []
+    confusable = _CONFUSABLE.search(text)
+    while confusable and (limit is None or len(words) < limit):
+        start, end = bounds.word(confusable.start(), confusable.end())
+        words.append(text[start:end])
+        confusable = _CONFUSABLE.search(text, end)
+    return words
@@ -0,0 +1,168 @@
+"""Index of recently banned texts that also finds their slightly changed copies.
+
+Spam campaigns repost the same text with swapped emoji, Latin lookalikes and other
+amounts. Such copies differ in a few characters, so neither the verdict cache nor the
+phrase lists catch them, but they share most of their character shingles.
+
+A text is reduced to a skeleton: casefolded words with lookalikes mapped to Cyrillic,
+every number replaced by "#" and everything else dropped. Its 5-character shingles
+get a MinHash signature by one permutation hashing: each shingle hash goes to one
+of SIGNATURE_BINS bins and every bin keeps its minimum. Signatures are split into
+bands; texts that agree on a whole band are candidates, and a candidate is a copy
+when the share of equal bins, an estimate of the shingle Jaccard similarity,
+reaches the threshold.
+"""
+import re
+import time
+from collections import OrderedDict
+from normalization import normalize
+
+SHINGLE = 5
+SIGNATURE_BINS = 32
+BAND_ROWS = 4
+# Shorter skeletons are common phrases rather than campaign texts
+MIN_SHINGLES = 24
+
+AUTOMATIC = "auto"
+VOTE = "vote"
+
+_SKELETON_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+# Latin letters that look like Cyrillic ones in either case
+_LOOKALIKES = str.maketrans("aceopxykmthb", "асеорхукмтнв")
+_LATIN = re.compile("[a-z]")
+# Empty bins borrow the value of the next filled bin, shifted by the distance
+_EMPTY = 1 << 64
+_DISTANCE = 1 << 65
+
+
+def skeleton(message):
+    """Words of a text with lookalikes mapped to Cyrillic and numbers replaced by "#"."""
+    folded = normalize(message).folded
+    if _LATIN.search(folded):
+        folded = folded.translate(_LOOKALIKES)
+    return " ".join("#" if token[0].isdigit() else token for token in _SKELETON_TOKEN.findall(folded))
+
+
+def signature(message):
+    """One permutation MinHash signature of the text, or None when the text is too short."""
+    text = skeleton(message)
+    if len(text) - SHINGLE + 1 < MIN_SHINGLES:
+        return None
+    bins = [_EMPTY] * SIGNATURE_BINS
+    for value in {hash(text[start:start + SHINGLE]) for start in range(len(text) - SHINGLE + 1)}:
+        # hash() of a str is keyed per process, so the low bits pick the bin
+        index = value % SIGNATURE_BINS
+        value //= SIGNATURE_BINS
+        if value < bins[index]:
+            bins[index] = value
+    for index, value in enumerate(bins):
+        if value == _EMPTY:
+            distance = 1
+            while bins[(index + distance) % SIGNATURE_BINS] == _EMPTY:
+                distance += 1
+            bins[index] = bins[(index + distance) % SIGNATURE_BINS] + distance * _DISTANCE
+    return tuple(bins)
+
+
+def similarity(first, second):
+    """Share of equal bins of two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_BINS
+
+
+class Fingerprint:
+    __slots__ = ("signature", "bands", "source", "expires_at")
+
+    def __init__(self, signature, bands, source, expires_at):
+        self.signature = signature
+        self.bands = bands
+        self.source = source
+        self.expires_at = expires_at
+
+
+class NearDuplicate:
+    """The banned text a message is a copy of: how similar it is and how it was banned."""
+
+    __slots__ = ("similarity", "source")
+
+    def __init__(self, similarity, source):
+        self.similarity = similarity
+        self.source = source
+
+
+class NearDuplicateIndex:
+    """Signatures of banned texts, the oldest dropped after ttl seconds or above maxsize.
+
+    version changes on every add, so cached "not spam" verdicts can tell they are stale.
+    """
+
+    def __init__(self, maxsize=5000, ttl=6 * 3600, threshold=0.7):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = 0
+        self._fingerprints = OrderedDict()
+        self._buckets = {}
+
+    def _bands(self, signature):
+        return [hash((start, signature[start:start + BAND_ROWS]))
+                for start in range(0, SIGNATURE_BINS, BAND_ROWS)]
+
+    def _drop(self, key):
+        fingerprint = self._fingerprints.pop(key)
+        for band in fingerprint.bands:
+            bucket = self._buckets[band]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band]
+
+    def _expire(self):
+        now = time.monotonic()
+        # Entries are kept in the order they expire
+        while self._fingerprints:
+            key, fingerprint = next(iter(self._fingerprints.items()))
+            if fingerprint.expires_at > now and len(self._fingerprints) <= self.maxsize:
+                break
+            self._drop(key)
+
+    def add(self, message, source=AUTOMATIC):
+        """Remember a banned text. Returns False when it is too short to fingerprint."""
+        message = normalize(message)
+        signature_ = signature(message)
+        if signature_ is None:
+            return False
+        key = message.digest
+        if key in self._fingerprints:
+            self._drop(key)
+        bands = self._bands(signature_)
+        self._fingerprints[key] = Fingerprint(signature_, bands, source, time.monotonic() + self.ttl)
+        for band in bands:
+            self._buckets.setdefault(band, set()).add(key)
+        self.version += 1
+        self._expire()
+        return True
+
+    def find(self, message):
+        """The closest banned text the message is a copy of, or None."""
+        if not self._fingerprints:
+            return None
+        signature_ = signature(message)
+        if signature_ is None:
+            return None
+        now = time.monotonic()
+        best = None
+        checked = set()
+        for band in self._bands(signature_):
+            for key in self._buckets.get(band, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                fingerprint = self._fingerprints[key]
+                if fingerprint.expires_at <= now:
+                    continue
+                score = similarity(signature_, fingerprint.signature)
+                if score >= self.threshold and (best is None or score > best.similarity):
+                    best = NearDuplicate(score, fingerprint.source)
+        return best
+
+    def __len__(self):
+        return len(self._fingerprints)
@@ -0,0 +1,156 @@
+import hashlib
+import re
+from functools import cached_property
+import emoji
+
+WORD_RE = re.compile(r"\w+")
+_CHECKMARK_RUN = re.compile("[✅\U0001F537]+")
+
+
+def trie_pattern(words):
+    """One expression matching any of words, longest first, shaped as a trie.
+
+    The engine walks the text once instead of trying every word at every position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return re.compile(build(trie))
+
+
+# Emoji sequences of the emoji package, grouped by first character. ZWJ sequences are
+# left out: they combine in ways no table lists, so texts with a ZWJ are counted by
+# the package itself. So are texts with tag characters, which follow 🏴 in the flags
+# of subdivisions such as England.
+_ZWJ = "\u200d"
+_TAG = re.compile("[\U000e0020-\U000e007f]")
+_KEYCAP_BASES = "0123456789#*"
+_EMOJI_SUFFIXES = {}
+for _key in emoji.EMOJI_DATA:
+    if _ZWJ not in _key:
+        _EMOJI_SUFFIXES.setdefault(_key[0], []).append(_key[1:])
+_EMOJI_TAILS = {}
+
+# Characters an emoji can start with. Digits, "#" and "*" only start one as a keycap.
+# The BMP characters and the astral planes are kept in separate classes: a class that
+# mixes both is checked entry by entry instead of through a bitmap.
+_EMOJI_START = re.compile(
+    "[" + "".join(re.escape(char) for char in sorted(_EMOJI_SUFFIXES)
+                  if char <= "\uffff" and char not in _KEYCAP_BASES) + "]"
+    "|[\U00010000-\U0010ffff]"
+    "|[0-9#*](?=\ufe0f?\u20e3)"
+)
+
+
+def _emoji_tail(first):
+    """Expression for the rest of the longest emoji that starts with first."""
+    tail = _EMOJI_TAILS.get(first)
+    if tail is None:
+        tail = _EMOJI_TAILS[first] = trie_pattern(_EMOJI_SUFFIXES[first])
+    return tail
+
+
+def count_emoji(text, limit=None):
+    """Number of emoji in text as emoji.emoji_list() counts them, but no more than limit."""
+    if _ZWJ in text or _TAG.search(text):
+        count = len(emoji.emoji_list(text))
+        return count if limit is None else min(count, limit)
+    count = 0
+    start = _EMOJI_START.search(text)
+    while start and count != limit:
+        position = start.start()
+        first = text[position]
+        tail = _emoji_tail(first).match(text, position + 1) if first in _EMOJI_SUFFIXES else None
+        if tail is None:
+            position += 1
+        else:
+            count += 1
+            position = tail.end()
+        start = _EMOJI_START.search(text, position)
+    return count
+
+
+def fold_case(text):
+    # str.casefold() expands "İ" to "i̇", while IGNORECASE matches it as a plain "i"
+    if "İ" in text:
+        text = text.replace("İ", "i")
+    return text.casefold()
+
+
+class NormalizedMessage:
+    """Everything the detectors derive from a message text, built once per update.
+
+    Each field is computed on first access, so a message stopped by an early gate costs
+    nothing.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._anchors_for = None
+        self._anchors = None
+
+    def __len__(self):
+        return len(self.text)
+
+    @cached_property
+    def digest(self):
+        """Fixed-size hash of the text, for cache keys that should not hold whole messages."""
+        return hashlib.blake2b(self.text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    @cached_property
+    def folded(self):
+        return fold_case(self.text)
+
+    @cached_property
+    def squeezed(self):
+        """Casefolded text with every whitespace run collapsed to one space."""
+        return " ".join(self.folded.split())
+
+    @cached_property
+    def words(self):
+        """Distinct casefolded words in order of first occurrence."""
+        return dict.fromkeys(WORD_RE.findall(self.folded))
+
+    @cached_property
+    def emoji_count(self):
+        return count_emoji(self.text)
+
+    def count_emoji(self, limit):
+        """Emoji count that stops at limit; the exact count is reused when already known."""
+        if "emoji_count" in self.__dict__:
+            return min(self.emoji_count, limit)
+        return count_emoji(self.text, limit)
+
+    @cached_property
+    def checkmark_run(self):
+        """Length of the longest run of ✅ and 🔷, which spammers use interchangeably."""
+        if "✅" not in self.text and "\U0001F537" not in self.text:
+            return 0
+        return max(len(run) for run in _CHECKMARK_RUN.findall(self.text))
+
+    def anchors(self, prefilter):
+        """Prefilter anchors found in the text, kept for the last prefilter asked."""
+        if self._anchors_for is not prefilter:
+            self._anchors = prefilter.scan(self.squeezed)
+            self._anchors_for = prefilter
+        return self._anchors
+
+
+def normalize(message):
+    """The NormalizedMessage of a text; a NormalizedMessage is returned as is."""
+    if isinstance(message, NormalizedMessage):
+        return message
+    return NormalizedMessage(message)
@@ -0,0 +1,181 @@
+"""Scheduling of outgoing Bot API requests.
+
+Every request made through the application's bot passes through OutboundScheduler,
+which PTB calls as its rate limiter. Requests take a token from a bot-wide bucket,
+and those of a lower priority class wait while a higher one is waiting, so a
+deletion never queues behind owner reports. Requests that send or edit a message
+also take a token from the bucket of their chat; reads such as getChat do not. A RetryAfter pauses the chat it came
+from (or the whole bot) for the time Telegram asks, and the request is retried;
+network errors are retried with exponential backoff.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import timedelta
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+from chat_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first. Pass one as rate_limit_args to override the
+# class the endpoint gets by default.
+MODERATION = 0
+INTERACTIVE = 1
+REPORT = 2
+
+MODERATION_ENDPOINTS = {"deleteMessage", "deleteMessages", "banChatMember"}
+# Safe to repeat after a timeout, when the first attempt may have gone through
+IDEMPOTENT_ENDPOINTS = MODERATION_ENDPOINTS | {
+    "editMessageReplyMarkup", "editMessageText", "answerCallbackQuery", "getChat", "getChatMember", "getMe",
+}
+
+# Telegram's per-chat limits count messages; calls starting with these send or edit one
+CHAT_RATE_PREFIXES = ("send", "edit", "copyMessage", "forwardMessage")
+
+# Telegram's limits: about 30 requests a second in total, one message a second in a
+# private chat and 20 a minute in a group
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20 / 60
+CHAT_BURST = 3
+
+
+def _seconds(retry_after):
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """rate tokens a second, at most capacity saved up. Also paused by flood control."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available."""
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.0)
+
+    def reserve(self):
+        """Take a token, going into debt if there is none: returns how long to wait for it."""
+        delay = self.delay()
+        self.tokens -= 1
+        return delay
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    def __init__(self, global_rate=GLOBAL_RATE, max_retries=3, backoff=0.5, max_backoff=10.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._global = TokenBucket(global_rate, global_rate)
+        # Idle buckets are full again long before they expire
+        self._chats = TTLCache(maxsize=10000, ttl=600)
+        self._waiting = []
+        self._order = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+
+    @property
+    def waiting(self):
+        """Requests waiting for a token of the global bucket."""
+        return len(self._waiting)
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            private = isinstance(chat_id, int) and chat_id > 0
+            bucket = TokenBucket(PRIVATE_CHAT_RATE if private else GROUP_CHAT_RATE, CHAT_BURST)
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _dispatch(self):
+        while True:
+            while not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            delay = self._global.delay()
+            if delay > 0:
+                # A more urgent request may arrive meanwhile, so the head is picked after the wait
+                await asyncio.sleep(delay)
+                continue
+            _, _, granted = heapq.heappop(self._waiting)
+            if not granted.done():
+                self._global.take()
+                granted.set_result(None)
+
+    async def _acquire(self, priority, chat_id, endpoint):
+        delay = 0.0
+        if chat_id is not None and priority == MODERATION:
+            # Moderation skips the per-chat rate but not a flood-control pause
+            bucket = self._chats.get(chat_id)
+            if bucket is not None:
+                delay = bucket.paused_until - time.monotonic()
+        elif chat_id is not None and endpoint.startswith(CHAT_RATE_PREFIXES):
+            delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), granted))
+        self._wakeup.set()
+        await granted
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = rate_limit_args if rate_limit_args is not None else (
+            MODERATION if endpoint in MODERATION_ENDPOINTS else INTERACTIVE)
+        chat_id = data.get("chat_id")
+        attempt = 0
+        while True:
+            await self._acquire(priority, chat_id, endpoint)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = _seconds(e.retry_after)
+                logger.warning("Flood control on %s in chat %s, waiting %.0f s", endpoint, chat_id, delay)
+                (self._chat_bucket(chat_id) if chat_id is not None else self._global).pause(delay)
+            except BadRequest:
+                raise
+            except NetworkError as e:
+                if attempt >= self.max_retries or (isinstance(e, TimedOut) and endpoint not in IDEMPOTENT_ENDPOINTS):
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning("%s failed (%s), retrying in %.1f s", endpoint, e, delay)
+                await asyncio.sleep(delay)
+            attempt += 1
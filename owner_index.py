@@ -0,0 +1,74 @@
+import copy
+
+
+class OwnerSettings:
+    """Per-chat settings of one owner, as stored in that owner's user document."""
+
+    __slots__ = ("user_id", "delete_statuses", "manual_ban_allowed", "emoji_limit", "digest_minutes")
+
+    def __init__(self, user_id, delete_statuses, manual_ban_allowed, emoji_limit=None, digest_minutes=None):
+        self.user_id = user_id
+        self.delete_statuses = delete_statuses
+        self.manual_ban_allowed = manual_ban_allowed
+        # None: the default limit
+        self.emoji_limit = emoji_limit
+        # Owner-wide; None: a report for every ban
+        self.digest_minutes = digest_minutes
+
+
+class OwnerIndex:
+    """In-memory chat_id -> owners map mirroring the user documents in the database.
+
+    Loaded once at startup; every handler that writes a user document passes the new
+    document to update_user(), so the message path never has to touch the database.
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._chats = {}
+        self._order = {}
+
+    def load(self, user_documents):
+        for user_data in user_documents:
+            self.update_user(user_data)
+
+    def update_user(self, user_data):
+        user_id = user_data['user_id']
+        self.remove_user(user_id)
+        self._order.setdefault(user_id, len(self._order))
+        user_data = copy.deepcopy(dict(user_data))
+        self._users[user_id] = user_data
+
+        delete_statuses = user_data.get('delete_statuses', {})
+        manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
+        emoji_limits = user_data.get('emoji_limits', {})
+        for chat_id in user_data.get('chats', []):
+            self._chats.setdefault(chat_id, {})[user_id] = OwnerSettings(
+                user_id,
+                delete_statuses.get(str(chat_id), False),
+                chat_id in manual_ban_allowed,
+                emoji_limits.get(str(chat_id)),
+                user_data.get('digest_minutes'),
+            )
+
+    def remove_user(self, user_id):
+        user_data = self._users.pop(user_id, None)
+        if user_data is None:
+            return
+        for chat_id in user_data.get('chats', []):
+            owners = self._chats.get(chat_id)
+            if owners is not None:
+                owners.pop(user_id, None)
+                if not owners:
+                    del self._chats[chat_id]
+
+    def get_user(self, user_id):
+        """The last known document of a user. Treat it as read-only."""
+        return self._users.get(user_id)
+
+    def owners(self, chat_id):
+        """Owners of a chat in the order they were first stored in the database."""
+        owners = self._chats.get(chat_id)
+        if not owners:
+            return []
+        return sorted(owners.values(), key=lambda owner: self._order[owner.user_id])
@@ -0,0 +1,154 @@
+"""Per-rule cost profile of the phrase lists and the word scanners.
+
+Each phrase is compiled and timed on its own, as are the mixed-words and confusables
+scanners: over the corpus, and over generated worst-case inputs of n, 2n and 4n characters. A rule whose time grows faster than
+the input is flagged as super-linear. The run fails when a rule goes over the budget
+on the largest input, so a rule that backtracks badly is caught before it ships.
+
+    python profile_rules.py                    # check all rules, exit 1 on a budget overrun
+    python profile_rules.py --top 20           # also list the 20 most expensive rules
+    python profile_rules.py --output rules.json
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+from benchmark import DEFAULT_CORPUS, load_corpus
+from classifier import MAX_MESSAGE_LENGTH
+from is_spam_message import _compile_rule, get_registry, parse_cooccurrence_rule, required_literals
+from mixed_script import find_confusable_words, find_mixed_words
+
+# Time on the 4n input above which a rule fails the check
+DEFAULT_BUDGET_US = 20_000
+# Time growth from 2n to 4n: about 2 for a linear rule, 4 for a quadratic one
+SUPERLINEAR_GROWTH = 3.0
+# Below this, timings are too small for the growth ratio to mean anything
+MIN_SIGNIFICANT_US = 1000
+
+
+def _repeat_to(unit, size):
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def worst_case_inputs(anchors, size):
+    """Texts of the given size built to make a regex retry at every position without matching.
+
+    Besides generic fillers, the rule's own literals are repeated, so that every
+    occurrence starts a partial match that has to be abandoned.
+    """
+    inputs = {
+        "digits": _repeat_to("1", size),
+        "letters": _repeat_to("а", size),
+        "words": _repeat_to("а ", size),
+        "mixed_script": _repeat_to("аb", size),
+        "separators": _repeat_to("а-b_", size),
+        "confusables": _repeat_to("а0", size),
+    }
+    if anchors:
+        anchor = min(anchors, key=len)
+        inputs["anchor_words"] = _repeat_to(anchor + " ", size)
+        inputs["anchor_run"] = _repeat_to(anchor, size)
+    return inputs
+
+
+def best_time_us(search, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        search(text)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / 1000
+
+
+def profile_rule(list_name, index, phrase, search, anchors, corpus, sizes, repeat):
+    corpus_times = [best_time_us(search, text, repeat) for text in corpus]
+    by_size = []
+    worst_input = None
+    for size in sizes:
+        times = {name: best_time_us(search, text, repeat)
+                 for name, text in worst_case_inputs(anchors, size).items()}
+        worst_input = max(times, key=times.get)
+        by_size.append(times[worst_input])
+    growth = by_size[-1] / by_size[-2] if by_size[-2] else 1.0
+    return {
+        "list": list_name,
+        "index": index,
+        "phrase": phrase,
+        "corpus_max_us": round(max(corpus_times), 1) if corpus_times else 0.0,
+        "corpus_total_us": round(sum(corpus_times), 1),
+        "worst_case_us": {str(size): round(value, 1) for size, value in zip(sizes, by_size)},
+        "worst_input": worst_input,
+        "growth": round(growth, 2),
+        "superlinear": growth > SUPERLINEAR_GROWTH and by_size[-1] >= MIN_SIGNIFICANT_US,
+    }
+
+
+def rules():
+    """(list name, index, phrase, search function, anchors) for every regex and scanner the bot runs.
+
+    Co-occurrence rules are matched on token sets, not as regexes, so they are skipped.
+    """
+    registry = get_registry()
+    for list_name, phrases in (("crit", registry.crit_phrases), ("main", registry.main_phrases),
+                               ("supporting", registry.supporting_phrases)):
+        for index, phrase in enumerate(phrases):
+            if parse_cooccurrence_rule(phrase):
+                continue
+            yield list_name, index, phrase, _compile_rule(phrase).search, required_literals(phrase)
+    # The scanners stop at the first words in the classifier; reports run them to the end
+    yield "mixed_words", 0, "find_mixed_words()", find_mixed_words, None
+    yield "confusables", 0, "find_confusable_words()", find_confusable_words, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-rule cost profile of the phrase lists")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--size", type=int, default=MAX_MESSAGE_LENGTH,
+                        help="n: worst-case inputs of n, 2n and 4n characters are generated")
+    parser.add_argument("--budget-us", type=float, default=DEFAULT_BUDGET_US,
+                        help="maximum time of one rule on the 4n input")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per input, the fastest is kept")
+    parser.add_argument("--top", type=int, default=0, help="list the N most expensive rules")
+    parser.add_argument("--output", help="write the profile as JSON")
+    args = parser.parse_args()
+
+    corpus = [message["text"] for message in load_corpus(args.corpus)]
+    sizes = [args.size, args.size * 2, args.size * 4]
+    profiles = [profile_rule(list_name, index, phrase, search, anchors, corpus, sizes, args.repeat)
+                for list_name, index, phrase, search, anchors in rules()]
+    largest = str(sizes[-1])
+    over_budget = [profile for profile in profiles if profile["worst_case_us"][largest] > args.budget_us]
+    superlinear = [profile for profile in profiles if profile["superlinear"]]
+
+    def show(profile):
+        print(f"  {profile['list']}[{profile['index']}] {profile['worst_case_us'][largest]} мкс "
+              f"на {largest} симв. ({profile['worst_input']}), рост x{profile['growth']}, "
+              f"корпус max {profile['corpus_max_us']} мкс: {profile['phrase']!r}")
+
+    print(f"Правил: {len(profiles)}, входы {', '.join(map(str, sizes))} символов, бюджет {args.budget_us:.0f} мкс")
+    if args.top:
+        print("Самые дорогие правила:")
+        ranked = sorted(profiles, key=lambda profile: profile["worst_case_us"][largest], reverse=True)
+        for profile in itertools.islice(ranked, args.top):
+            show(profile)
+    if superlinear:
+        print(f"Сверхлинейный рост ({len(superlinear)}):")
+        for profile in superlinear:
+            show(profile)
+    if over_budget:
+        print(f"Превышен бюджет ({len(over_budget)}):")
+        for profile in over_budget:
+            show(profile)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"sizes": sizes, "budget_us": args.budget_us, "rules": profiles},
+                      file, ensure_ascii=False, indent=2)
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
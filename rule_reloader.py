@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+import time
+from is_spam_message import RULE_FILES, RULES_DIR, get_registry, load_registry, set_registry
+
+logger = logging.getLogger(__name__)
+
+
+class RuleReloader:
+    """Recompiles the rule files on a worker thread and swaps the new registry in.
+
+    The event loop only awaits the compilation, so updates keep flowing while it
+    runs. A background task polls the file modification times; reload() can also be
+    called directly. A file that fails to compile leaves the running rules in place.
+    """
+
+    def __init__(self, directory=RULES_DIR, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._mtimes = self._read_mtimes()
+        self._watcher = None
+
+    def _read_mtimes(self):
+        mtimes = {}
+        for name in RULE_FILES.values():
+            try:
+                mtimes[name] = os.stat(os.path.join(self.directory, name)).st_mtime_ns
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+    async def reload(self):
+        """Compile the files and swap them in. Returns (registry, seconds, changed).
+
+        Raises ValueError or OSError when a file cannot be read or compiled.
+        """
+        async with self._lock:
+            self._mtimes = self._read_mtimes()
+            started = time.perf_counter()
+            registry = await asyncio.to_thread(load_registry, self.directory)
+            elapsed = time.perf_counter() - started
+            previous = get_registry()
+            changed = registry.version != previous.version
+            if changed:
+                set_registry(registry)
+                logger.warning("Rules %s -> %s compiled in %.0f ms: %d critical, %d main, %d supporting",
+                               previous.version, registry.version, elapsed * 1000, len(registry.crit_phrases),
+                               len(registry.main_phrases), len(registry.supporting_phrases))
+            return registry, elapsed, changed
+
+    def start(self):
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._read_mtimes() == self._mtimes:
+                continue
+            try:
+                await self.reload()
+            except (OSError, ValueError) as e:
+                logger.warning("Rules not reloaded: %s", e)
+            except Exception:
+                logger.exception("Rules not reloaded")
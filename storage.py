@@ -0,0 +1,326 @@
+import asyncio
+import functools
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from tinydb import TinyDB, Query
+from tinydb.operations import delete
+
+User = Query()
+
+# User documents returned by every backend have the TinyDB layout:
+# {'user_id': int, 'chats': [chat_id, ...], 'delete_statuses': {str(chat_id): bool},
+#  'manual_ban_allowed': [chat_id, ...], 'emoji_limits': {str(chat_id): int}, 'digest_minutes': int}
+# Chats without an entry in 'emoji_limits' use the default limit. Owners without
+# 'digest_minutes' get a report for every ban instead of a digest.
+
+
+class Storage(ABC):
+    """Operations the bot handlers need. Every write returns the updated user document."""
+
+    @abstractmethod
+    def all_users(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def register_chat(self, user_id, chat_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def unregister_chat(self, user_id, chat_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_delete_statuses(self, user_id, chat_id, enabled):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_manual_ban(self, user_id, chat_id, allowed):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_emoji_limit(self, user_id, chat_id, limit):
+        """Set the emoji limit of a chat; None restores the default."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_digest(self, user_id, minutes):
+        """Collect the owner's ban reports into a digest every so many minutes; None turns it off."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TinyDBStorage(Storage):
+    """The original JSON file. Every write serializes the whole database."""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            with open(path, "w") as file:
+                file.write("{}")
+        self.db = TinyDB(path)
+
+    def all_users(self):
+        return self.db.all()
+
+    def get_user(self, user_id):
+        return self.db.get(User.user_id == user_id)
+
+    def register_chat(self, user_id, chat_id):
+        user_data = self.get_user(user_id)
+        if user_data:
+            if chat_id not in user_data['chats']:
+                user_data['chats'].append(chat_id)
+                if 'delete_statuses' not in user_data:
+                    user_data['delete_statuses'] = {}
+                user_data['delete_statuses'][str(chat_id)] = False
+                self.db.update(user_data, User.user_id == user_id)
+        else:
+            user_data = {'user_id': user_id, 'chats': [chat_id], 'delete_statuses': {str(chat_id): False}}
+            self.db.insert(user_data)
+        return user_data
+
+    def unregister_chat(self, user_id, chat_id):
+        user_data = self.get_user(user_id)
+        user_data['chats'].remove(chat_id)
+        if 'delete_statuses' in user_data:
+            user_data['delete_statuses'].pop(str(chat_id), None)
+        if 'emoji_limits' in user_data:
+            user_data['emoji_limits'].pop(str(chat_id), None)
+        self.db.update(user_data, User.user_id == user_id)
+        return user_data
+
+    def set_delete_statuses(self, user_id, chat_id, enabled):
+        user_data = self.get_user(user_id)
+        if enabled and 'delete_statuses' not in user_data:
+            user_data['delete_statuses'] = {}
+        if 'delete_statuses' in user_data:
+            user_data['delete_statuses'][str(chat_id)] = enabled
+        self.db.update(user_data, User.user_id == user_id)
+        return user_data
+
+    def set_manual_ban(self, user_id, chat_id, allowed):
+        user_data = self.get_user(user_id)
+        manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
+        if allowed:
+            manual_ban_allowed.add(chat_id)
+        else:
+            manual_ban_allowed.discard(chat_id)
+        user_data['manual_ban_allowed'] = list(manual_ban_allowed)
+        self.db.update({'manual_ban_allowed': user_data['manual_ban_allowed']}, User.user_id == user_id)
+        return user_data
+
+    def set_emoji_limit(self, user_id, chat_id, limit):
+        user_data = self.get_user(user_id)
+        emoji_limits = user_data.get('emoji_limits', {})
+        if limit is None:
+            emoji_limits.pop(str(chat_id), None)
+        else:
+            emoji_limits[str(chat_id)] = limit
+        user_data['emoji_limits'] = emoji_limits
+        self.db.update({'emoji_limits': emoji_limits}, User.user_id == user_id)
+        return user_data
+
+    def set_digest(self, user_id, minutes):
+        user_data = self.get_user(user_id)
+        if minutes is None:
+            if user_data.pop('digest_minutes', None) is not None:
+                self.db.update(delete('digest_minutes'), User.user_id == user_id)
+        else:
+            user_data['digest_minutes'] = minutes
+            self.db.update({'digest_minutes': minutes}, User.user_id == user_id)
+        return user_data
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteStorage(Storage):
+    """One indexed row per (owner, chat) in a WAL-mode SQLite file; writes touch only that row."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS owner_chats (
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            delete_statuses INTEGER NOT NULL DEFAULT 0,
+            manual_ban INTEGER NOT NULL DEFAULT 0,
+            emoji_limit INTEGER,
+            PRIMARY KEY (user_id, chat_id)
+        );
+        CREATE INDEX IF NOT EXISTS owner_chats_chat_id ON owner_chats (chat_id);
+        CREATE TABLE IF NOT EXISTS owners (
+            user_id INTEGER PRIMARY KEY,
+            digest_minutes INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, migrate_from=None):
+        # Handlers may call in from an executor thread; all access goes through one thread
+        # at a time, so sharing the connection is safe.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self._add_missing_columns()
+        if migrate_from and os.path.exists(migrate_from):
+            self.migrate_from_tinydb(migrate_from)
+
+    def _add_missing_columns(self):
+        # Files created before a column existed get it added with its default
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(owner_chats)")}
+        if 'emoji_limit' not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE owner_chats ADD COLUMN emoji_limit INTEGER")
+
+    def migrate_from_tinydb(self, path):
+        """Copy the JSON database into the table once; later calls are no-ops."""
+        if self.connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+            return
+        tinydb = TinyDB(path)
+        rows = []
+        owners = []
+        for user_data in tinydb.all():
+            if user_data.get('digest_minutes') is not None:
+                owners.append((user_data['user_id'], user_data['digest_minutes']))
+            delete_statuses = user_data.get('delete_statuses', {})
+            manual_ban_allowed = set(user_data.get('manual_ban_allowed', []))
+            emoji_limits = user_data.get('emoji_limits', {})
+            for chat_id in user_data.get('chats', []):
+                rows.append((user_data['user_id'], chat_id,
+                             bool(delete_statuses.get(str(chat_id), False)), chat_id in manual_ban_allowed,
+                             emoji_limits.get(str(chat_id))))
+        tinydb.close()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO owner_chats (user_id, chat_id, delete_statuses, manual_ban, emoji_limit) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO owners (user_id, digest_minutes) VALUES (?, ?)", owners)
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (path,))
+
+    def _documents(self, where="", params=()):
+        users = {}
+        cursor = self.connection.execute(
+            "SELECT user_id, chat_id, delete_statuses, manual_ban, emoji_limit FROM owner_chats "
+            f"{where} ORDER BY rowid", params)
+        for user_id, chat_id, delete_statuses, manual_ban, emoji_limit in cursor:
+            user_data = users.setdefault(user_id, {
+                'user_id': user_id, 'chats': [], 'delete_statuses': {}, 'manual_ban_allowed': [],
+                'emoji_limits': {}})
+            user_data['chats'].append(chat_id)
+            user_data['delete_statuses'][str(chat_id)] = bool(delete_statuses)
+            if manual_ban:
+                user_data['manual_ban_allowed'].append(chat_id)
+            if emoji_limit is not None:
+                user_data['emoji_limits'][str(chat_id)] = emoji_limit
+        # Owner-wide settings outlive the chats, but only owners with a chat have a document
+        cursor = self.connection.execute(
+            f"SELECT user_id, digest_minutes FROM owners {where}", params)
+        for user_id, digest_minutes in cursor:
+            if user_id in users and digest_minutes is not None:
+                users[user_id]['digest_minutes'] = digest_minutes
+        return list(users.values())
+
+    def all_users(self):
+        return self._documents()
+
+    def get_user(self, user_id):
+        users = self._documents("WHERE user_id = ?", (user_id,))
+        return users[0] if users else None
+
+    def _write(self, sql, params, user_id):
+        with self.connection:
+            self.connection.execute(sql, params)
+        return self.get_user(user_id) or {'user_id': user_id, 'chats': [], 'delete_statuses': {}}
+
+    def register_chat(self, user_id, chat_id):
+        return self._write("INSERT OR IGNORE INTO owner_chats (user_id, chat_id) VALUES (?, ?)",
+                           (user_id, chat_id), user_id)
+
+    def unregister_chat(self, user_id, chat_id):
+        return self._write("DELETE FROM owner_chats WHERE user_id = ? AND chat_id = ?",
+                           (user_id, chat_id), user_id)
+
+    def set_delete_statuses(self, user_id, chat_id, enabled):
+        return self._write("UPDATE owner_chats SET delete_statuses = ? WHERE user_id = ? AND chat_id = ?",
+                           (enabled, user_id, chat_id), user_id)
+
+    def set_manual_ban(self, user_id, chat_id, allowed):
+        return self._write("UPDATE owner_chats SET manual_ban = ? WHERE user_id = ? AND chat_id = ?",
+                           (allowed, user_id, chat_id), user_id)
+
+    def set_emoji_limit(self, user_id, chat_id, limit):
+        return self._write("UPDATE owner_chats SET emoji_limit = ? WHERE user_id = ? AND chat_id = ?",
+                           (limit, user_id, chat_id), user_id)
+
+    def set_digest(self, user_id, minutes):
+        return self._write("INSERT INTO owners (user_id, digest_minutes) VALUES (?, ?) "
+                           "ON CONFLICT (user_id) DO UPDATE SET digest_minutes = excluded.digest_minutes",
+                           (user_id, minutes), user_id)
+
+    def close(self):
+        self.connection.close()
+
+
+class AsyncStorage:
+    """Runs a Storage on a single worker thread so file I/O never blocks the event loop.
+
+    One thread means calls execute in the order they were awaited, which keeps writes
+    ordered without extra locking. The message path reads OwnerIndex, not this.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+    async def all_users(self):
+        return await self._call(self.backend.all_users)
+
+    async def get_user(self, user_id):
+        return await self._call(self.backend.get_user, user_id)
+
+    async def register_chat(self, user_id, chat_id):
+        return await self._call(self.backend.register_chat, user_id, chat_id)
+
+    async def unregister_chat(self, user_id, chat_id):
+        return await self._call(self.backend.unregister_chat, user_id, chat_id)
+
+    async def set_delete_statuses(self, user_id, chat_id, enabled):
+        return await self._call(self.backend.set_delete_statuses, user_id, chat_id, enabled)
+
+    async def set_manual_ban(self, user_id, chat_id, allowed):
+        return await self._call(self.backend.set_manual_ban, user_id, chat_id, allowed)
+
+    async def set_emoji_limit(self, user_id, chat_id, limit):
+        return await self._call(self.backend.set_emoji_limit, user_id, chat_id, limit)
+
+    async def set_digest(self, user_id, minutes):
+        return await self._call(self.backend.set_digest, user_id, minutes)
+
+    async def close(self):
+        # Runs after every queued write
+        await self._call(self.backend.close)
+        self._executor.shutdown(wait=True)
+
+
+def open_storage():
+    """Backend chosen by ANTISPAM_STORAGE: "tinydb" (default) or "sqlite"."""
+    json_path = os.getenv('ANTISPAM_DB_PATH', "./bot_database.json")
+    if os.getenv('ANTISPAM_STORAGE', "tinydb").lower() == "sqlite":
+        sqlite_path = os.getenv('ANTISPAM_SQLITE_PATH', "./bot_database.sqlite3")
+        return SQLiteStorage(sqlite_path, migrate_from=json_path)
+    return TinyDBStorage(json_path)
@@ -0,0 +1,33 @@
+import pytest
+import is_spam_message
+from classifier import classifier
+from is_spam_message import PatternRegistry
+
+SUPPORTING = r"\bв\s*лс\b"
+
+
+@pytest.mark.parametrize("main_phrase", [
+    r"удал[её]нн\w+\s+работ\w*",
+    # A co-occurrence rule, matched over the words instead of as a regex
+    r"(?=.*\bудал\w*)(?=.*\bработ\w*)",
+])
+def test_spam_phrases_category_comes_from_the_main_rule(monkeypatch, main_phrase):
+    registry = PatternRegistry([], [main_phrase], [SUPPORTING],
+                               {main_phrase: "recruitment", SUPPORTING: "contact"})
+    monkeypatch.setattr(is_spam_message, "_registry", registry)
+
+    verdict = classifier.classify("Удалённая работа с телефона, подробности пишите в лс")
+
+    assert verdict.is_spam
+    assert verdict.decided_by == "spam_phrases"
+    assert verdict.category == "recruitment"
+
+
+def test_spam_phrases_needs_a_supporting_phrase(monkeypatch):
+    main_phrase = r"удал[её]нн\w+\s+работ\w*"
+    monkeypatch.setattr(is_spam_message, "_registry", PatternRegistry([], [main_phrase], [SUPPORTING]))
+
+    verdict = classifier.classify("Удалённая работа: как не выгореть дома")
+
+    assert not verdict.is_spam
+    assert verdict.spam_match is None
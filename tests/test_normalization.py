@@ -0,0 +1,17 @@
+import emoji
+import pytest
+from normalization import count_emoji
+
+SCOTLAND = "\U0001f3f4\U000e0067\U000e0062\U000e0073\U000e0063\U000e0074\U000e007f"
+
+
+@pytest.mark.parametrize("text", [
+    "Привет 😀👍🏽 #тег 1️⃣ 🇷🇺",
+    f"Болеем за {SCOTLAND}{SCOTLAND} 🎉",
+    # Tag characters the emoji table does not list as a flag
+    "\U0001f3f4\U000e0067\U000e0067\U000e007f😀",
+])
+def test_count_emoji_matches_emoji_list(text):
+    expected = len(emoji.emoji_list(text))
+    assert count_emoji(text) == expected
+    assert count_emoji(text, 2) == min(expected, 2)
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import outbound
+from actions import NotificationQueue
+from outbound import CHAT_BURST, INTERACTIVE, REPORT, OutboundScheduler
+
+RATE = 20.0
+REPORTS = 8
+# Sleeps overshoot a little
+SLACK = 0.03
+
+
+def _check_rate(times, started):
+    """No chat is sent more than CHAT_BURST messages at once and RATE a second after that."""
+    for index, sent in enumerate(sorted(times)):
+        assert sent - started >= (index + 1 - CHAT_BURST) / RATE - SLACK
+
+
+async def _two_owner_bursts():
+    scheduler = OutboundScheduler()
+    await scheduler.initialize()
+    notifications = NotificationQueue()
+    sent = {}
+
+    async def send_message(chat_id, kind):
+        sent.setdefault(chat_id, []).append((kind, time.monotonic()))
+
+    def request(chat_id, kind, priority):
+        return scheduler.process_request(send_message, (chat_id, kind), {}, "sendMessage",
+                                         {"chat_id": chat_id}, priority)
+
+    started = time.monotonic()
+    # The second owner's reports are queued behind the whole burst of the first
+    for owner_id in (101, 102):
+        for _ in range(REPORTS):
+            notifications.submit(owner_id, lambda owner_id=owner_id: request(owner_id, "report", REPORT))
+    await asyncio.sleep(2 / RATE)
+    replies = {}
+    for owner_id in (101, 102):
+        asked = time.monotonic()
+        await request(owner_id, "reply", INTERACTIVE)
+        replies[owner_id] = time.monotonic() - asked
+    assert await notifications.drain(5)
+    await scheduler.shutdown()
+    return started, sent, replies
+
+
+def test_owners_keep_to_the_chat_rate_on_their_own(monkeypatch):
+    monkeypatch.setattr(outbound, "PRIVATE_CHAT_RATE", RATE)
+    started, sent, replies = asyncio.run(_two_owner_bursts())
+
+    for owner_id in (101, 102):
+        kinds = [kind for kind, _ in sent[owner_id]]
+        assert kinds.count("report") == REPORTS and kinds.count("reply") == 1
+        _check_rate([moment for _, moment in sent[owner_id]], started)
+        # Both bursts are sent side by side, not one after the other
+        last = max(moment for _, moment in sent[owner_id])
+        assert last - started <= (REPORTS + 1 - CHAT_BURST) / RATE + 2 * SLACK
+        # A reply waits for at most the report in flight, not for the rest of the burst
+        assert replies[owner_id] <= 2 / RATE + SLACK
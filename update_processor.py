@@ -0,0 +1,59 @@
+import asyncio
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Updates allowed to wait for their turn, across all chats
+MAX_PENDING_UPDATES = 4096
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates of different chats concurrently and those of one chat in order.
+
+    Votes in ban_callback and the /ban duplicate check rely on updates of a chat being
+    processed one after another. Each update waits for the previous update of its chat
+    before it takes one of max_running running slots, so a busy chat queues behind
+    itself without holding slots that other chats could use. The base class limit
+    (max_concurrent_updates) only bounds how many updates may be waiting. on_wait, when
+    given, is called with the seconds each update waited before it started.
+    """
+
+    def __init__(self, max_running, max_pending=MAX_PENDING_UPDATES, on_wait=None):
+        super().__init__(max_pending)
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._tails = {}
+        self._on_wait = on_wait
+
+    async def _run(self, coroutine, started):
+        async with self._running:
+            if self._on_wait is not None:
+                self._on_wait(time.perf_counter() - started)
+            await coroutine
+
+    async def do_process_update(self, update, coroutine):
+        started = time.perf_counter()
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await self._run(coroutine, started)
+            return
+
+        # Registering the tail happens before the first await, so updates of a chat are
+        # chained in the order they enter this method.
+        previous = self._tails.get(chat.id)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[chat.id] = done
+        try:
+            if previous is not None:
+                # Shielded: cancelling this update must not cancel the one it waits for
+                await asyncio.shield(previous)
+            await self._run(coroutine, started)
+        finally:
+            done.set_result(None)
+            if self._tails.get(chat.id) is done:
+                del self._tails[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bots cannot delete messages older than 48 hours, so abandoned votes are cleaned up well before
+VOTE_TTL = 24 * 3600
+
+
+class Vote:
+    """A /ban vote, stored under the chat and the id of the bot's message with the buttons."""
+
+    __slots__ = ("chat_id", "vote_message_id", "target_message_id", "target_user_id", "command_message_id",
+                 "invoker", "target_text", "confirm", "cancel", "expires_at")
+
+    def __init__(self, chat_id, vote_message_id, target_message_id, target_user_id, command_message_id,
+                 invoker, target_text, confirm=(), cancel=(), expires_at=None):
+        self.chat_id = chat_id
+        self.vote_message_id = vote_message_id
+        self.target_message_id = target_message_id
+        self.target_user_id = target_user_id
+        self.command_message_id = command_message_id
+        self.invoker = invoker
+        # Kept so that copies of the text are caught once the vote bans it
+        self.target_text = target_text
+        self.confirm = set(confirm)
+        self.cancel = set(cancel)
+        # Wall-clock time, so it survives a restart
+        self.expires_at = expires_at
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["confirm"] = sorted(self.confirm)
+        data["cancel"] = sorted(self.cancel)
+        return data
+
+
+class VoteStore:
+    """Votes in progress, looked up by vote message or by target message in O(1).
+
+    A vote that is not decided within ttl seconds is dropped and handed to the
+    on_expire coroutine, which removes its messages. A background task does that and
+    writes the votes to a JSON file when they changed, so a restart resumes them.
+    """
+
+    def __init__(self, path=None, ttl=VOTE_TTL, interval=60.0):
+        self.path = path
+        self.ttl = ttl
+        self.interval = interval
+        self._votes = {}
+        self._targets = {}
+        self._dirty = False
+        self._task = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                records = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Votes not loaded from %s: %s", self.path, e)
+            return
+        if not isinstance(records, list):
+            logger.warning("Votes not loaded from %s: not a list of votes", self.path)
+            return
+        for record in records:
+            try:
+                vote = Vote(**record)
+                if not isinstance(vote.expires_at, (int, float)):
+                    raise TypeError(f"expires_at is {vote.expires_at!r}")
+            except (TypeError, KeyError) as e:
+                logger.warning("Vote skipped in %s: %s", self.path, e)
+                continue
+            self._index(vote)
+
+    def save(self):
+        records = [vote.to_dict() for vote in self._votes.values()]
+        self._dirty = False
+        self._write(records)
+
+    def _write(self, records):
+        # Replaced in one step, so a crash mid-write keeps the previous file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(records, file, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    def _index(self, vote):
+        self._votes[vote.chat_id, vote.vote_message_id] = vote
+        self._targets[vote.chat_id, vote.target_message_id] = vote
+
+    def add(self, vote):
+        if vote.expires_at is None:
+            vote.expires_at = time.time() + self.ttl
+        self._index(vote)
+        self._dirty = True
+
+    def get(self, chat_id, vote_message_id):
+        return self._votes.get((chat_id, vote_message_id))
+
+    def for_target(self, chat_id, target_message_id):
+        """The vote in progress on a message, or None."""
+        return self._targets.get((chat_id, target_message_id))
+
+    def changed(self, vote):
+        """Mark a vote as changed in place, so the next save includes it."""
+        self._dirty = True
+
+    def remove(self, vote):
+        self._votes.pop((vote.chat_id, vote.vote_message_id), None)
+        if self._targets.get((vote.chat_id, vote.target_message_id)) is vote:
+            del self._targets[vote.chat_id, vote.target_message_id]
+        self._dirty = True
+
+    def pop_expired(self):
+        now = time.time()
+        expired = [vote for vote in self._votes.values() if vote.expires_at <= now]
+        for vote in expired:
+            self.remove(vote)
+        return expired
+
+    def __len__(self):
+        return len(self._votes)
+
+    def start(self, on_expire):
+        self._task = asyncio.create_task(self._run(on_expire))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.path and self._dirty:
+            self.save()
+
+    async def _run(self, on_expire):
+        while True:
+            for vote in self.pop_expired():
+                try:
+                    await on_expire(vote)
+                except Exception:
+                    logger.exception("Expired vote in chat %s not cleaned up", vote.chat_id)
+            if self.path and self._dirty:
+                records = [vote.to_dict() for vote in self._votes.values()]
+                self._dirty = False
+                try:
+                    await asyncio.to_thread(self._write, records)
+                except OSError as e:
+                    self._dirty = True
+                    logger.warning("Votes not saved to %s: %s", self.path, e)
+            await asyncio.sleep(self.interval)